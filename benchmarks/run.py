@@ -0,0 +1,174 @@
+"""Time the pipeline stages on synthetic data and keep the history of results
+
+    python benchmarks/run.py --samples 10000 --rbps 1500 --isoforms 30 --shape imbalanced
+
+Every run appends a json line (parameters, commit, versions and median stage times) to the
+history file, `--compare` prints the history of the runs with the same parameters.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_dataset
+from src.helpers.pipeline import make_transcripts_tree
+from src.model import TreeModel
+from src.pipeline import Pipeline
+from src.utils.matrix_cache import read_table, save_matrix_cache
+from src.utils.motifs import get_motif_scanner
+from src.utils.profiler import Profiler
+
+
+default_history_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.jsonl')
+params_keys = ['samples', 'rbps', 'isoforms', 'shape', 'tissues', 'tissue_specific', 'n_jobs', 'seed']
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_io(rbp_df, output_dir, profiler):
+    """Writing and reading of the RBP expression table in all supported formats"""
+    tsv_path = os.path.join(output_dir, 'rbps.tsv')
+    parquet_path = os.path.join(output_dir, 'rbps.parquet')
+    cache_path = os.path.join(output_dir, 'rbps.cache')
+    with profiler.stage('io.write_tsv'):
+        rbp_df.to_csv(tsv_path, sep='\t')
+    with profiler.stage('io.write_parquet'):
+        rbp_df.to_parquet(parquet_path)
+    with profiler.stage('io.write_cache'):
+        save_matrix_cache(rbp_df, cache_path)
+    for name, path, read in [('tsv', tsv_path, read_table), ('parquet', parquet_path, pd.read_parquet), ('cache', cache_path, read_table)]:
+        with profiler.stage(f'io.read_{name}'):
+            df = read(path)
+            # Cache is memory mapped, touch the values to read them
+            df.select_dtypes('number').to_numpy().sum()
+
+
+def run_once(args, dataset, output_dir):
+    gene_data, rbp_df, isoforms_df, rbps = dataset
+    config = {
+        'gene': gene_data['gene_name'],
+        'output_dir': output_dir,
+        'tissue_specific': args.tissue_specific,
+        'n_jobs': args.n_jobs,
+        'random_state': args.seed,
+        'cache': False,
+        'plots': 'none',
+    }
+    profiler = Profiler()
+    get_motif_scanner.cache_clear()
+
+    with profiler.stage('tree'):
+        make_transcripts_tree(gene_data['transcripts'], gene_data['variable_exon_numbers'])
+    pipeline = Pipeline(config, gene_data, rbp_df, isoforms_df, rbps, profiler=profiler)
+    pipeline.run()
+
+    model = TreeModel.load(os.path.join(output_dir, 'model.npz'))
+    with profiler.stage('model.predict'):
+        model.predict(rbp_df, by_tissue=args.tissue_specific)
+    if args.io:
+        time_io(rbp_df, output_dir, profiler)
+
+    return profiler
+
+
+def run(args):
+    start = time.perf_counter()
+    dataset = make_dataset(
+        n_samples=args.samples, n_rbps=args.rbps, n_isoforms=args.isoforms,
+        shape=args.shape, n_tissues=args.tissues, seed=args.seed,
+    )
+    print(f'Generated data in {time.perf_counter() - start:.1f}s')
+
+    runs = []
+    for i in range(args.repeat):
+        with tempfile.TemporaryDirectory() as output_dir:
+            profiler = run_once(args, dataset, output_dir)
+        runs.append({stage: values['time'] for stage, values in profiler.summary().items()})
+        print(f'Run {i + 1}/{args.repeat}: ' + ', '.join(f'{stage} {t:.3f}s' for stage, t in runs[-1].items()))
+
+    times = pd.DataFrame(runs)
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'params': {key: getattr(args, key) for key in params_keys},
+        'repeat': args.repeat,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'cpu_count': os.cpu_count(),
+        'stages': times.median().to_dict(),
+        'stages_min': times.min().to_dict(),
+        'max_rss_mb': max(record['max_rss_mb'] for record in profiler.records),
+    }
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(history, params):
+    runs = [run for run in history if run['params'] == params]
+    if not runs:
+        print('No runs with the same parameters')
+        return None
+
+    table = pd.DataFrame(
+        [run['stages'] for run in runs],
+        index=[f"{run['timestamp']} {run.get('commit') or ''}".strip() for run in runs],
+    ).T
+    print(table.to_string(float_format='{:.3f}'.format))
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pipeline benchmark on synthetic data')
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--rbps', type=int, default=200)
+    parser.add_argument('--isoforms', type=int, default=8)
+    parser.add_argument('--shape', choices=['balanced', 'imbalanced'], default='balanced')
+    parser.add_argument('--tissues', type=int, default=5)
+    parser.add_argument('--no-tissue-specific', dest='tissue_specific', action='store_false',
+                        help='Fit only the models on all tissues.')
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-io', dest='io', action='store_false',
+                        help='Do not time reading and writing of the expression table.')
+    parser.add_argument('--history', default=default_history_path,
+                        help='History file (json lines); Default: %(default)s.')
+    parser.add_argument('--compare', action='store_true',
+                        help='Print the history of runs with the same parameters.')
+    args = parser.parse_args()
+
+    result = run(args)
+    with open(args.history, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+    print(f'Saved to {args.history}')
+
+    if args.compare:
+        compare(load_history(args.history), result['params'])
+
+
+if __name__ == '__main__':
+    main()
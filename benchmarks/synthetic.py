@@ -0,0 +1,94 @@
+"""Synthetic genes, motifs and expression tables for benchmarks
+
+Gene annotations follow the genes index format (see src/helpers/genes.py), so the
+generated data goes through the same code as real genes.
+"""
+import numpy as np
+import pandas as pd
+
+from src.helpers.pipeline import map_exons_to_numbers, set_variable_exons
+
+
+def isoform_exons(n_isoforms, shape='balanced'):
+    """Variable exons of every isoform, they define the shape of the isoforms tree
+
+    balanced: isoform i has variable exon b if bit b of i is set, so every split halves the isoforms.
+    imbalanced: isoform i has variable exons i, i + 1, ..., so every split separates a single
+        isoform and the tree depth is n_isoforms - 1 (like CD44).
+    """
+    if shape == 'balanced':
+        n_exons = max(1, int(np.ceil(np.log2(n_isoforms))))
+        return n_exons, [[b for b in range(n_exons) if i >> (n_exons - 1 - b) & 1] for i in range(n_isoforms)]
+    if shape == 'imbalanced':
+        n_exons = n_isoforms - 1
+        return n_exons, [list(range(i, n_exons)) for i in range(n_isoforms)]
+    raise ValueError(f'Unknown tree shape {shape}')
+
+
+def make_gene(n_isoforms=8, shape='balanced', exon_len=150, intron_len=1000, seed=0, name='SYNTH'):
+    rng = np.random.default_rng(seed)
+    n_variable, variable_exons = isoform_exons(n_isoforms, shape)
+    # Constant first and last exons around the variable ones
+    n_exons = n_variable + 2
+    exons = [
+        {'exon_number': i + 1, 'start': i * (exon_len + intron_len), 'end': i * (exon_len + intron_len) + exon_len}
+        for i in range(n_exons)
+    ]
+    transcripts = [
+        {
+            'transcript_id': f'{name}-T{i + 1:03d}',
+            'exons': [exons[0]] + [exons[e + 1] for e in isoform] + [exons[-1]],
+        }
+        for i, isoform in enumerate(variable_exons)
+    ]
+    sequence = ''.join(rng.choice(list('ACGT'), size=exons[-1]['end']))
+
+    gene_data = {'gene_name': name, 'sequence': sequence, 'exons': exons, 'transcripts': transcripts}
+    gene_data = set_variable_exons(map_exons_to_numbers(gene_data))
+    gene_data['sequence'] = gene_data['sequence'].replace('T', 'U')
+    return gene_data
+
+
+def make_motifs(rbps, motifs_per_rbp=3, motif_len=(4, 8), seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Gene': [rbp for rbp in rbps for _ in range(motifs_per_rbp)],
+        'Motif': [
+            ''.join(rng.choice(list('ACGU'), size=rng.integers(motif_len[0], motif_len[1] + 1)))
+            for _ in range(len(rbps) * motifs_per_rbp)
+        ],
+    })
+
+
+def make_expression(transcripts, n_samples=1000, n_rbps=100, n_tissues=5, n_informative=20, seed=0):
+    """RBPs and isoforms expression (FPKM) of the samples, isoforms fractions depend on a few RBPs"""
+    rng = np.random.default_rng(seed)
+    samples = [f'S{i:06d}' for i in range(n_samples)]
+    rbps = [f'RBP{i:05d}' for i in range(n_rbps)]
+    tissues = rng.integers(n_tissues, size=n_samples)
+
+    # log2 expression with a tissue specific shift
+    log_rbps = rng.normal(4, 1.5, size=(n_samples, n_rbps)) + rng.normal(0, 1, size=(n_tissues, n_rbps))[tissues]
+    rbp_df = pd.DataFrame(2**log_rbps - 1, index=samples, columns=rbps).clip(lower=0)
+    rbp_df['Tissue'] = [f'TISSUE{t}' for t in tissues]
+
+    weights = np.zeros((n_rbps, len(transcripts)))
+    informative = rng.choice(n_rbps, size=min(n_informative, n_rbps), replace=False)
+    weights[informative] = rng.normal(0, .5, size=(len(informative), len(transcripts)))
+    logits = (log_rbps - log_rbps.mean(axis=0)) @ weights + rng.normal(0, .5, size=(n_samples, len(transcripts)))
+    fractions = np.exp(logits - logits.max(axis=1, keepdims=True))
+    fractions /= fractions.sum(axis=1, keepdims=True)
+    total = 2**rng.normal(7, 1, size=(n_samples, 1))
+    isoforms_df = pd.DataFrame(fractions * total, index=samples, columns=transcripts)
+
+    return rbp_df, isoforms_df
+
+
+def make_dataset(n_samples=1000, n_rbps=100, n_isoforms=8, shape='balanced', n_tissues=5, seed=0):
+    gene_data = make_gene(n_isoforms, shape=shape, seed=seed)
+    rbp_df, isoforms_df = make_expression(
+        [t['transcript_id'] for t in gene_data['transcripts']],
+        n_samples=n_samples, n_rbps=n_rbps, n_tissues=n_tissues, seed=seed,
+    )
+    rbps = make_motifs([c for c in rbp_df.columns if c != 'Tissue'], seed=seed)
+    return gene_data, rbp_df, isoforms_df, rbps
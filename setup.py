@@ -21,6 +21,7 @@ setuptools.setup(
         'scikit-learn',
         'numpy',
         'pandas',
+        'pyarrow',
     ],
     classifiers=[
         'Programming Language :: Python :: 3',
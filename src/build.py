@@ -1,21 +1,159 @@
+import os
 import sys
+import json
+import time
+import logging
+import traceback
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 
-from src.helpers.pipeline import load_config_and_input_data
+import pandas as pd
+
+from src.helpers.pipeline import load_config, load_shared_data, load_gene_input_data, load_config_and_input_data
 from src.pipeline import Pipeline
+from src.plot import render
+from src.utils.common import make_sure_dir_exists, setup_logging
+from src.utils.profiler import aggregate_profiles, make_profiler
+
+
+logger = logging.getLogger(__name__)
+
+
+# Read-only inputs shared by batch workers (inherited on fork)
+_shared = {}
+
+
+def load_genes(genes_path):
+    with open(genes_path, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def init_worker(config, config_dirname, rbp_df, rbps):
+    _shared.update(config=config, config_dirname=config_dirname, rbp_df=rbp_df, rbps=rbps)
+
+
+def run_gene(gene):
+    config = _shared['config']
+    start = time.time()
+    output_dir = os.path.join(config['output_dir'], gene)
+    try:
+        gene_config = {k: v for k, v in config.items() if k != 'genes'}
+        gene_config['gene'] = gene
+        gene_config['output_dir'] = make_sure_dir_exists(output_dir)
+        with open(os.path.join(output_dir, 'config.json'), 'w') as f:
+            json.dump(gene_config, f, indent=2)
+
+        profiler = make_profiler(gene_config)
+        with profiler.stage('load'):
+            gene_data, rbp_df, isoforms_df = load_gene_input_data(
+                gene_config, _shared['config_dirname'], gene, _shared['rbp_df'],
+            )
+        pipeline = Pipeline(gene_config, gene_data, rbp_df, isoforms_df, _shared['rbps'], profiler=profiler)
+        pipeline.run()
+        status, error = 'ok', ''
+    except Exception:
+        status, error = 'failed', traceback.format_exc()
+        logger.error('%s failed:\n%s', gene, error)
+
+    return {
+        'gene': gene,
+        'status': status,
+        'time': time.time() - start,
+        'output_dir': output_dir,
+        'error': error.strip().split('\n')[-1] if error else '',
+    }
+
 
+def get_plots_executor(config, n_tasks=1):
+    """Background pool rendering plots from the saved results (only for 'deferred' plots)"""
+    if config.get('plots', 'deferred') != 'deferred':
+        return None
+    # Spawned processes do not inherit the input data of the compute workers
+    return ProcessPoolExecutor(min(config.get('plot_processes', 1), n_tasks), mp_context=mp.get_context('spawn'))
+
+
+def wait_plots(futures):
+    statuses = {}
+    for output_dir, future in futures.items():
+        try:
+            future.result()
+            statuses[output_dir] = 'ok'
+        except Exception:
+            statuses[output_dir] = 'failed'
+            logger.exception('Plots of %s failed', output_dir)
+
+    return statuses
+
+
+def run_batch(config, config_dirname, genes, shared_data=None):
+    config['output_dir'] = make_sure_dir_exists(os.path.join(config_dirname, config['output_dir']))
+    profiler = make_profiler(config)
+    with profiler.stage('load_shared'):
+        rbp_df, rbps = shared_data if shared_data is not None else load_shared_data(config, config_dirname)
+    logger.info('Loaded shared data, running %d genes...', len(genes))
+
+    n_processes = min(config.get('n_processes', os.cpu_count()), len(genes))
+    ctx = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else mp.get_context()
+    statuses = []
+    plots_executor = get_plots_executor(config, len(genes))
+    plots = {}
+    with ctx.Pool(n_processes, initializer=init_worker, initargs=(config, config_dirname, rbp_df, rbps)) as pool:
+        for status in pool.imap_unordered(run_gene, genes):
+            statuses.append(status)
+            logger.info('[%d/%d] %s: %s (%.1fs)', len(statuses), len(genes), status['gene'], status['status'], status['time'])
+            if plots_executor is not None and status['status'] == 'ok':
+                plots[status['output_dir']] = plots_executor.submit(render, status['output_dir'])
+
+    if plots_executor is not None:
+        logger.info('Waiting for plots...')
+        plots = wait_plots(plots)
+        plots_executor.shutdown()
+        for status in statuses:
+            status['plots'] = plots.get(status['output_dir'], '')
+
+    statuses = pd.DataFrame(statuses).set_index('gene').loc[genes]
+    statuses.to_csv(os.path.join(config['output_dir'], 'status.tsv'), sep='\t')
+    logger.info('Finished: %d ok, %d failed', (statuses['status'] == 'ok').sum(), (statuses['status'] != 'ok').sum())
+
+    # Batch profile: shared stages and per stage summary over all genes
+    profiler.save(os.path.join(config['output_dir'], 'profile.json'), genes=len(genes))
+    report = aggregate_profiles([os.path.join(output_dir, 'profile.json') for output_dir in statuses['output_dir']])
+    if not report.empty:
+        report.to_csv(os.path.join(config['output_dir'], 'profile.tsv'), sep='\t')
+        logger.info('Stages profile:\n%s', report.to_string(float_format='{:.2f}'.format))
+
+    return statuses
+
+
+def main(config_path, genes_path=None, shared_data=None):
+    """Run the pipeline of the configuration file for a single gene or a batch of genes
+
+    `shared_data` are the RBP expression and motifs tables of the config (see `load_shared_data`), if already loaded
+    """
+    config, config_dirname = load_config(config_path)
+    setup_logging(config.get('log_level', 'INFO'))
+    genes = load_genes(genes_path) if genes_path is not None else config.get('genes')
+    if genes:
+        return run_batch(config, config_dirname, list(dict.fromkeys(genes)), shared_data=shared_data)
 
-def main(config_path):
     # Load config and input data
-    config, gene_data, rbp_df, isoforms_df, rbps = load_config_and_input_data(config_path)
-    print(rbps)
+    profiler = make_profiler(config)
+    with profiler.stage('load'):
+        config, gene_data, rbp_df, isoforms_df, rbps = load_config_and_input_data(config_path, shared_data=shared_data)
+    logger.debug('RBPs:\n%s', rbps)
 
-    pipeline = Pipeline(config, gene_data, rbp_df, isoforms_df, rbps)
+    pipeline = Pipeline(config, gene_data, rbp_df, isoforms_df, rbps, profiler=profiler)
     pipeline.run()
 
+    plots_executor = get_plots_executor(config)
+    if plots_executor is not None:
+        with plots_executor:
+            wait_plots({config['output_dir']: plots_executor.submit(render, config['output_dir'])})
+
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
         print('Please specify configuration file', file=sys.stderr)
         sys.exit(1)
 
-    main(sys.argv[1])
+    main(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
@@ -1,11 +1,16 @@
 import os
-import json
 
 
 muted_columns = ['Tissue', 'fraq', 'Group', 'Dataset.Type', 'Freq']
+# Parameters of the `elastic_net` configuration option
+elastic_net_params = ['alpha', 'l1_ratio', 'cv']
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
-genes_data = json.load(open('/huge/bulk/ENSEMBLE/genes.json', 'r'))
+genes_path = '/huge/bulk/ENSEMBLE/genes.json'
+# Per-gene index of genes.json, built on the first access in the user cache (see src/helpers/genes.py)
+genes_index_path = os.environ.get(
+    'SRPSEQ_GENES_INDEX', os.path.join(os.path.expanduser('~'), '.cache', 'srpseq', 'genes.sqlite'),
+)
 
 exon_len = 10
 intron_len = 15
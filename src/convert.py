@@ -0,0 +1,44 @@
+import os
+import sys
+import logging
+
+import pandas as pd
+
+from src.utils.common import make_sure_dir_exists
+from src.utils.matrix_cache import save_matrix_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+def convert_table(input_path, output_path, transpose=False, unlog=False, dtype='float32'):
+    logger.info('Converting %s...', input_path)
+    df = pd.read_csv(input_path, sep='\t', index_col=0)
+    if transpose:
+        df = df.T
+    if unlog:
+        df = 2**df - 1
+    save_matrix_cache(df, output_path, dtype=dtype)
+
+
+def main(input_path, output_path, transpose=False, unlog=False, dtype='float32'):
+    if not os.path.isdir(input_path):
+        return convert_table(input_path, output_path, transpose=transpose, unlog=unlog, dtype=dtype)
+
+    # Convert every table of the directory, e.g. isoforms/by_gene/{gene}_isoform_FPKM.tsv
+    make_sure_dir_exists(output_path)
+    for file_name in sorted(os.listdir(input_path)):
+        if file_name.endswith('.tsv'):
+            convert_table(
+                os.path.join(input_path, file_name),
+                os.path.join(output_path, f'{file_name[:-len(".tsv")]}.cache'),
+                transpose=transpose, unlog=unlog, dtype=dtype,
+            )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Please specify input and output paths', file=sys.stderr)
+        sys.exit(1)
+
+    main(sys.argv[1], sys.argv[2])
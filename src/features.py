@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from src.consts import muted_columns
+
+
+class FeatureMatrix:
+    """RBP expression matrix shared by all tree nodes, each node keeps only its column positions and `fraq` vector"""
+
+    def __init__(self, df):
+        self.index = df.index
+        self.columns = pd.Index([c for c in df.columns if c not in muted_columns])
+        self.values = df[self.columns].to_numpy()
+        self.meta = df[[c for c in df.columns if c in muted_columns]]
+
+    def positions(self, columns):
+        positions = self.columns.get_indexer(pd.Index(columns))
+        return positions[positions >= 0]
+
+    def frame(self, features, fraq, rows=None):
+        rows = np.arange(len(self.index)) if rows is None else rows
+        df = pd.DataFrame(self.values[np.ix_(rows, features)], index=self.index[rows], columns=self.columns[features])
+        df['fraq'] = fraq[rows]
+        for c in self.meta.columns:
+            df[c] = self.meta[c].to_numpy()[rows]
+
+        return df
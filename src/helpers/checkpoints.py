@@ -0,0 +1,73 @@
+import os
+import json
+import pickle
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from src.utils.common import make_sure_dir_exists
+
+
+def update_hash(hash_, obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        if isinstance(obj, pd.DataFrame):
+            hash_.update(json.dumps([str(c) for c in obj.columns]).encode())
+        hash_.update(pd.util.hash_pandas_object(obj, index=not isinstance(obj, pd.Index)).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        hash_.update(f'{obj.dtype}{obj.shape}'.encode())
+        hash_.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        for key in sorted(obj, key=str):
+            update_hash(hash_, str(key))
+            update_hash(hash_, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        hash_.update(f'{type(obj).__name__}{len(obj)}'.encode())
+        for item in obj:
+            update_hash(hash_, item)
+    else:
+        hash_.update(json.dumps(obj, default=str).encode())
+
+
+def fingerprint(*objs):
+    """Content hash of (nested dicts / lists of) data frames, arrays and json-serializable objects"""
+    hash_ = hashlib.blake2b(digest_size=16)
+    for obj in objs:
+        update_hash(hash_, obj)
+
+    return hash_.hexdigest()
+
+
+class Checkpoints:
+    """Pickled stage outputs stored under the hash of the stage inputs, no-op if `cache_dir` is None"""
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+
+    def path(self, stage, key):
+        return os.path.join(self.cache_dir, stage, f'{key}.pkl')
+
+    def load(self, stage, key):
+        if self.cache_dir is None or not os.path.isfile(self.path(stage, key)):
+            return None
+
+        with open(self.path(stage, key), 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, stage, key, value):
+        if self.cache_dir is None:
+            return
+
+        make_sure_dir_exists(os.path.join(self.cache_dir, stage))
+        tmp_path = f'{self.path(stage, key)}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path(stage, key))
+
+    def cached(self, stage, key, func):
+        value = self.load(stage, key)
+        if value is None:
+            value = func()
+            self.save(stage, key, value)
+
+        return value
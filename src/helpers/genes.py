@@ -0,0 +1,78 @@
+import os
+import json
+import fcntl
+import logging
+import sqlite3
+from functools import lru_cache
+
+from src.consts import genes_path, genes_index_path
+
+
+logger = logging.getLogger(__name__)
+
+
+# Connections are opened lazily and per process, so forked workers never share one
+_connections = {}
+
+
+def is_index_outdated(json_path, index_path):
+    return not os.path.isfile(index_path) or (
+        os.path.isfile(json_path) and os.path.getmtime(index_path) < os.path.getmtime(json_path)
+    )
+
+
+def build_genes_index(json_path=genes_path, index_path=genes_index_path):
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    # Concurrent workers wait for the one building the index instead of building it again
+    with open(f'{index_path}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not is_index_outdated(json_path, index_path):
+            return
+
+        logger.info('Building genes index %s...', index_path)
+        with open(json_path, 'r') as f:
+            genes = json.load(f)
+
+        tmp_path = f'{index_path}.{os.getpid()}.tmp'
+        conn = sqlite3.connect(tmp_path)
+        with conn:
+            conn.execute('CREATE TABLE genes (name TEXT PRIMARY KEY, data TEXT)')
+            conn.executemany('INSERT INTO genes VALUES (?, ?)', ((name, json.dumps(data)) for name, data in genes.items()))
+        conn.close()
+        os.replace(tmp_path, index_path)
+
+
+@lru_cache(maxsize=1)
+def load_genes_json(json_path=genes_path):
+    with open(json_path, 'r') as f:
+        return json.load(f)
+
+
+def get_connection(index_path=genes_index_path):
+    """Connection to the genes index, None if the index cannot be built (genes are then read from the json file)"""
+    key = (os.getpid(), index_path)
+    if key not in _connections:
+        try:
+            if is_index_outdated(genes_path, index_path):
+                build_genes_index(genes_path, index_path)
+            _connections[key] = sqlite3.connect(f'file:{index_path}?mode=ro', uri=True, check_same_thread=False)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning('Cannot use genes index %s (%s), reading %s instead', index_path, e, genes_path)
+            _connections[key] = None
+
+    return _connections[key]
+
+
+def get_gene_data(gene_name, index_path=genes_index_path):
+    conn = get_connection(index_path)
+    if conn is None:
+        genes = load_genes_json(genes_path)
+        if gene_name not in genes:
+            raise ValueError(f'Gene {gene_name} is not found in {genes_path}.')
+        return genes[gene_name]
+
+    row = conn.execute('SELECT data FROM genes WHERE name = ?', (gene_name, )).fetchone()
+    if row is None:
+        raise ValueError(f'Gene {gene_name} is not found in {index_path}.')
+
+    return json.loads(row[0])
@@ -41,6 +41,14 @@ def get_accuracy(model, df, is_numpy=False):
     }
 
 
+def inlier_rows(fraq, tr=5):
+    """Positions of the non-missing fractions within `tr` standard deviations of their mean"""
+    valid = np.flatnonzero(~np.isnan(fraq))
+    if not len(valid):
+        return valid
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return valid[np.abs(zscore(fraq[valid])) < tr]
+
+
 def remove_outliers(df, tr=5):
-    df = df[~df['fraq'].isna()]
-    return df[np.abs(zscore(df['fraq'])) < tr]
+    return df.iloc[inlier_rows(df['fraq'].to_numpy(dtype=np.float64), tr)]
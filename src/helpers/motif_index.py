@@ -0,0 +1,66 @@
+import os
+import json
+import logging
+from functools import lru_cache
+
+import numpy as np
+
+from src.helpers.checkpoints import fingerprint
+from src.utils.motifs import get_motif_scanner
+
+
+logger = logging.getLogger(__name__)
+
+
+class MotifIndex:
+    """Motif hits on whole gene sequences stored on disk, shared by all runs with the same motif table
+
+    Hits of a gene are saved to `{index_dir}/{motif table hash}/{gene}.npz`: start positions sorted by motif,
+    positions of motif m are `positions[offsets[m]:offsets[m + 1]]`. Hits are re-scanned if the gene sequence changes.
+    """
+
+    def __init__(self, index_dir, motifs, pwms=()):
+        self.scanner = get_motif_scanner(motifs, pwms)
+        self.dir = os.path.join(index_dir, fingerprint(self.scanner.motifs, pwms))
+
+    def path(self, gene):
+        return os.path.join(self.dir, f'{gene}.npz')
+
+    def hits(self, gene, sequence):
+        """Start positions and motif ids (in `scanner.motifs`) of all motif occurrences in the gene sequence"""
+        hits = self.load(gene, sequence)
+        if hits is None:
+            hits = self.scanner.scan(sequence)
+            self.save(gene, sequence, *hits)
+
+        return hits
+
+    def load(self, gene, sequence):
+        if not os.path.isfile(self.path(gene)):
+            return None
+
+        with np.load(self.path(gene)) as data:
+            if str(data['sequence']) != fingerprint(sequence):
+                return None
+            offsets = data['offsets']
+            positions = data['positions'].astype(np.int64)
+
+        return positions, np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+    def save(self, gene, sequence, positions, motif_ids):
+        if not os.path.isdir(self.dir):
+            os.makedirs(self.dir, exist_ok=True)
+            with open(os.path.join(self.dir, 'motifs.json'), 'w') as f:
+                json.dump(self.scanner.motifs, f)
+
+        order = np.lexsort((positions, motif_ids))
+        offsets = np.searchsorted(motif_ids[order], np.arange(len(self.scanner.motifs) + 1))
+        tmp_path = f'{self.path(gene)}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, sequence=fingerprint(sequence), offsets=offsets, positions=positions[order].astype(np.uint32))
+        os.replace(tmp_path, self.path(gene))
+
+
+@lru_cache(maxsize=8)
+def get_motif_index(index_dir, motifs, pwms=()):
+    return MotifIndex(index_dir, motifs, pwms)
@@ -3,22 +3,37 @@ import sys
 import os
 import re
 import json
-from functools import partial
+import logging
+from functools import partial, lru_cache
 from shutil import copyfile
-import matplotlib.pyplot as plt
 import numpy as np
 
-from src.consts import genes_data, base_dir, muted_columns
-from src.helpers.plots import plot_gene_isoforms
+from src.consts import base_dir, elastic_net_params, muted_columns
+from src.helpers.genes import get_gene_data
+from src.helpers.motif_index import get_motif_index
+from src.features import FeatureMatrix
 from src.tree import TranscriptsTreeNode
-from src.utils.common import find_substring_occurrences, intersect_dfs, make_sure_dir_exists
+from src.utils.common import intersect_dfs, make_sure_dir_exists
+from src.utils.matrix_cache import is_matrix_cache, load_matrix_cache, read_table
+from src.utils.motifs import get_motif_scanner, read_meme, table_motifs
 
 
-def load_rbp_data():
-    return pd.read_csv('/huge/bulk/TCGA/TCGA-COMBINED/combined/sfs_FPKM.tsv', sep='\t', index_col=0).T
+logger = logging.getLogger(__name__)
+
+
+def load_rbp_data(columns=None):
+    # Binary cache made by `srpseq convert -i sfs_FPKM.tsv -o sfs_FPKM.cache --transpose`
+    if is_matrix_cache('/huge/bulk/TCGA/TCGA-COMBINED/combined/sfs_FPKM.cache'):
+        return load_matrix_cache('/huge/bulk/TCGA/TCGA-COMBINED/combined/sfs_FPKM.cache', columns=columns)
+
+    return read_table('/huge/bulk/TCGA/TCGA-COMBINED/combined/sfs_FPKM.tsv', columns=columns, transpose=True)
 
 
 def load_isoforms(gene_name):
+    # Binary cache made by `srpseq convert -i by_gene/ -o by_gene/ --unlog`
+    if is_matrix_cache(f'/huge/bulk/TCGA/TCGA-COMBINED/isoforms/by_gene/{gene_name}_isoform_FPKM.cache'):
+        return load_matrix_cache(f'/huge/bulk/TCGA/TCGA-COMBINED/isoforms/by_gene/{gene_name}_isoform_FPKM.cache')
+
     return 2**pd.read_csv(f'/huge/bulk/TCGA/TCGA-COMBINED/isoforms/by_gene/{gene_name}_isoform_FPKM.tsv', sep='\t', index_col=0) - 1
 
 
@@ -26,18 +41,27 @@ def load_rbps():
     return pd.read_csv(f'{base_dir}/../data/new_splicing_factors_symbols.tsv', sep='\t', index_col=0)
 
 
+def exon_membership(structure, exons):
+    """Bool matrix of transcripts x exons, `structure` is the list of exon numbers of every transcript"""
+    membership = np.zeros((len(structure), len(exons)), dtype=bool)
+    positions = {e: i for i, e in enumerate(exons)}
+    for i, exon_numbers in enumerate(structure):
+        membership[i, [positions[e] for e in exon_numbers if e in positions]] = True
+
+    return membership
+
+
 def get_first_variable_exon(transcripts, starting=-1):
-    all_exons = list(sorted(set(e for transcript in transcripts for e in transcript['exon_numbers'] if e > starting)))
-    for e in all_exons:
-        for transcript in transcripts:
-            if e not in transcript['exon_numbers']:
-                return e
+    exons = sorted(set(e for transcript in transcripts for e in transcript['exon_numbers'] if e > starting))
+    membership = exon_membership([transcript['exon_numbers'] for transcript in transcripts], exons)
+    variable = np.flatnonzero(~membership.all(axis=0))
 
-    return None
+    return exons[variable[0]] if len(variable) else None
 
 
 def set_variable_exons(gene_data):
-    common_exons = [e for e in gene_data['exon_numbers'] if all([e in transcript['exon_numbers'] for transcript in gene_data['transcripts']])]
+    membership = exon_membership([transcript['exon_numbers'] for transcript in gene_data['transcripts']], gene_data['exon_numbers'])
+    common_exons = set(e for e, common in zip(gene_data['exon_numbers'], membership.all(axis=0)) if common)
     gene_data['variable_exon_numbers'] = [e for e in gene_data['exon_numbers'] if e not in common_exons]
     gene_data['variable_exons'] = [e for e in gene_data['exons'] if e['exon_number'] not in common_exons]
     for transcript in gene_data['transcripts']:
@@ -55,81 +79,121 @@ def map_exons_to_numbers(gene_data):
     return gene_data
 
 
+def rna_sequence(sequence):
+    return sequence.replace('T', 'U')
+
+
 def load_data(gene_name):
-    return map_exons_to_numbers(genes_data.copy().get(gene_name))
+    return map_exons_to_numbers(get_gene_data(gene_name))
 
 
 def filter_columns_by_expression(df, tresh_mean, tresh_var):
-    return df.drop(columns=[
-        c for c in df
-        if np.issubdtype(df[c].dtype, np.number) and (df[c].mean() < tresh_mean or df[c].var() < tresh_var)
-    ])
-
-
-def make_exon_sf_df(sfs_df, isoforms_df, gene_exon_motifs, exon_number, node_isoforms, parent_isoforms, tr_low=1.0, tr_high=0.0):
-    exon_sfs = set(gene_exon_motifs[
-       (gene_exon_motifs['Number'].astype(int) == exon_number)
-       & (
-               (gene_exon_motifs['Pos'] == 'Exon')
-               | ((gene_exon_motifs['Loc.Percent'] >= tr_high) | (gene_exon_motifs['Loc.Percent'] <= tr_low))
-       )
-    ].index)
-    #
-    exon_df = sfs_df[set(exon_sfs) & set(sfs_df.columns)]
-    exon_df.loc[:, 'fraq'] = isoforms_df[node_isoforms].sum(axis=1) / isoforms_df[parent_isoforms].sum(axis=1)
-    exon_df.loc[:, 'fraq'] = (exon_df['fraq'] * (len(exon_df) - 1) + 0.5) / len(exon_df)
-    exon_df.loc[:, set(sfs_df.columns) - set(exon_df.columns)] = sfs_df[set(sfs_df.columns) - set(exon_df.columns)]
+    numeric = df.select_dtypes('number')
+    return df.drop(columns=numeric.columns[(numeric.mean() < tresh_mean) | (numeric.var() < tresh_var)])
+
+
+def exon_motif_rbps(gene_exon_motifs, tr_low=1.0, tr_high=0.0):
+    """RBPs with motifs on every exon (or in the preceding intron, if within the `tr_high` / `tr_low` thresholds)"""
+    selected = gene_exon_motifs[
+        (gene_exon_motifs['Pos'] == 'Exon')
+        | ((gene_exon_motifs['Loc.Percent'] >= tr_high) | (gene_exon_motifs['Loc.Percent'] <= tr_low))
+    ]
+    return {
+        int(exon_number): set(rbps)
+        for exon_number, rbps in pd.Series(selected.index, index=selected['Number'].astype(int)).groupby(level=0)
+    }
+
+
+def make_exon_sf_features(matrix, isoforms_df, exon_sfs, node_isoforms, parent_isoforms, motif_rbps_only=False):
+    features = matrix.positions([c for c in matrix.columns if c in exon_sfs])
+    if not motif_rbps_only:
+        features = np.concatenate([features, np.setdiff1d(np.arange(len(matrix.columns)), features)])
+    fraq = (isoforms_df[node_isoforms].sum(axis=1) / isoforms_df[parent_isoforms].sum(axis=1)).reindex(matrix.index).to_numpy(dtype=np.float64)
+    fraq = (fraq * (len(fraq) - 1) + 0.5) / len(fraq)
     #
-    return exon_df
+    return features, fraq
 
 
-def make_transcripts_tree(transcripts, exons):
-    transcripts_tree = TranscriptsTreeNode(kwargs=transcripts)
-    parents = [transcripts_tree]
-    for lvl in range(len(exons)):
+@lru_cache(maxsize=256)
+def tree_topology(structure, exons):
+    """Isoforms tree of transcripts with exon numbers `structure` (tuple of tuples), split by sorted `exons`
+
+    Topology depends only on the exon structure, so it is shared by genes (and runs) with the same one.
+    Returns nodes in breadth-first order as (parent position, divider exon, transcripts positions), root first.
+    """
+    exons = np.asarray(exons)
+    membership = exon_membership(structure, exons.tolist())
+    nodes = [(-1, -1, np.arange(len(structure)))]
+    parents = [0]
+    while parents:
         cur_parents = []
         for parent in parents:
-            parent_transcripts = parent.kwargs
-            if len(parent_transcripts) > 1:
-                variable_exon = get_first_variable_exon(parent_transcripts, starting=parent.divider_exon)
-                if variable_exon is not None:
-                    lhs_node, rhs_node = [], []
-                    for transcript in parent_transcripts:
-                        if variable_exon in transcript['variable_exon_numbers']:
-                            lhs_node.append(transcript)
-                        else:
-                            rhs_node.append(transcript)
-                    lhs_node = TranscriptsTreeNode(kwargs=lhs_node, parent=parent, divider_exon=variable_exon)
-                    rhs_node = TranscriptsTreeNode(kwargs=rhs_node, parent=parent, divider_exon=variable_exon)
-                    parent.set_children(left=lhs_node, right=rhs_node)
-                    cur_parents += [lhs_node, rhs_node]
+            _, divider_exon, rows = nodes[parent]
+            if len(rows) < 2:
+                continue
+            # First exon after the parent divider which is in some but not all node transcripts
+            candidates = np.flatnonzero(exons > divider_exon)
+            node_membership = membership[np.ix_(rows, candidates)]
+            variable = np.flatnonzero(node_membership.any(axis=0) & ~node_membership.all(axis=0))
+            if not len(variable):
+                continue
+            is_left = node_membership[:, variable[0]]
+            variable_exon = exons[candidates[variable[0]]].item()
+            nodes += [(parent, variable_exon, rows[is_left]), (parent, variable_exon, rows[~is_left])]
+            cur_parents += [len(nodes) - 2, len(nodes) - 1]
         parents = cur_parents
 
-    return transcripts_tree
+    return tuple((parent, divider_exon, tuple(rows.tolist())) for parent, divider_exon, rows in nodes)
 
 
-def make_exons_sf_df(gene_data, sfs_df, isoforms_df, gene_exon_motifs):
+def make_transcripts_tree(transcripts, exons):
+    topology = tree_topology(
+        tuple(tuple(transcript['exon_numbers']) for transcript in transcripts),
+        tuple(sorted(set(exons))),
+    )
+    nodes = []
+    for parent, divider_exon, rows in topology:
+        node = TranscriptsTreeNode(
+            kwargs=[transcripts[i] for i in rows],
+            parent=nodes[parent] if parent >= 0 else None,
+            divider_exon=divider_exon,
+        )
+        # Children follow their parent in pairs, left one first
+        if parent >= 0 and nodes[parent].left_child is None:
+            nodes[parent].left_child = node
+        elif parent >= 0:
+            nodes[parent].right_child = node
+        nodes.append(node)
+
+    return nodes[0]
+
+
+def make_exons_sf_df(gene_data, sfs_df, isoforms_df, gene_exon_motifs, motif_rbps_only=False, tr_low=1.0, tr_high=0.0):
     transcripts = gene_data['transcripts']
     transcripts = [t for t in transcripts if t['transcript_id'] in isoforms_df.columns]
     exons = gene_data['variable_exon_numbers']
 
     transcripts_tree = make_transcripts_tree(transcripts, exons)
+    matrix = FeatureMatrix(sfs_df)
+    exons_sfs = exon_motif_rbps(gene_exon_motifs, tr_low=tr_low, tr_high=tr_high)
 
     nodes = [transcripts_tree.left_child, transcripts_tree.right_child]
     while len(nodes):
         for node_id, node in enumerate(nodes):
+            node.matrix = matrix
             if node_id % 2 == 0:
                 parent_transcripts = node.parent.kwargs
                 node_transcripts = node.kwargs
-                node.df = make_exon_sf_df(
-                    sfs_df, isoforms_df, gene_exon_motifs,
-                    node.divider_exon,
+                node.features, node.fraq = make_exon_sf_features(
+                    matrix, isoforms_df, exons_sfs.get(node.divider_exon, set()),
                     [t['transcript_id'] for t in node_transcripts],
                     [t['transcript_id'] for t in parent_transcripts],
+                    motif_rbps_only=motif_rbps_only,
                 )
             else:
-                node.df = nodes[node_id - 1].df.copy()
-                node.df['fraq'] = 1 - node.df['fraq']
+                # Siblings share the features, the right one models the complementary ratio
+                node.features = nodes[node_id - 1].features
+                node.fraq = 1 - nodes[node_id - 1].fraq
 
         cur_nodes = []
         for node in nodes:
@@ -140,8 +204,7 @@ def make_exons_sf_df(gene_data, sfs_df, isoforms_df, gene_exon_motifs):
     return transcripts_tree
 
 
-def map_motifs_to_exons(gene_data, motifs_data):
-    motifs = motifs_data.copy()
+def map_motifs_to_exons(gene_data, motifs_data, motif_index_dir=None):
     exons = pd.DataFrame(gene_data['exons']).drop_duplicates()
     variable_exons = pd.DataFrame(gene_data['variable_exons']).drop_duplicates()
     if variable_exons.iloc[0]['exon_number'] != 1:
@@ -149,87 +212,165 @@ def map_motifs_to_exons(gene_data, motifs_data):
     else:
         start = 0
     end = variable_exons.iloc[-1]['end']
-    gene_seq = gene_data['sequence'][start: end]
     variable_exons.loc[:, ['start', 'end']] = variable_exons.loc[:, ['start', 'end']] - start
-    motifs['in gene'] = motifs['Motif'].apply(lambda x: x in gene_seq)
-    motifs = motifs[motifs['in gene'] == True]
-
-    motif_exons = pd.DataFrame()
-    for motif in set(motifs['Motif']):
-        motif_locs = find_substring_occurrences(motif, gene_seq)
-        motif_chunk = []
-        for loc in motif_locs:
-            motif_chunk.append(find_nearest_exon(loc, variable_exons))
-        motif_chunk = pd.DataFrame(motif_chunk)
-        motif_chunk['Motif'] = [motif] * len(motif_chunk)
-        motif_exons = pd.concat([motif_exons, motif_chunk], axis=0)
-
-    return motif_exons.merge(motifs_data, on='Motif').set_index('Gene')
-
-
-def find_nearest_exon(loc, exons):
-    inside_exon = exons[(exons['start'] <= loc) & (exons['end'] >= loc)]
-    if not inside_exon.empty:
-        inside_exon = inside_exon.iloc[0]
-        return {
-            'Pos': 'Exon',
-            'Number': inside_exon['exon_number'],
-            'Loc.Absolute': loc,
-            'Loc.Relative': loc - inside_exon['start'],
-            'Loc.Percent': (loc - inside_exon['start']) / (inside_exon['end'] - inside_exon['start']),
-        }
-
-    idx = exons[(exons['start'] >= loc)]['start'].idxmin()
-    nearest_exon = exons.loc[idx]
-    if nearest_exon.name == 0:
-        prev_end = 0
-    else:
-        prev_end = exons.iloc[exons.index.get_loc(nearest_exon.name) - 1]['end']
-
-    return {
-        'Pos': 'Intron',
-        'Number': nearest_exon['exon_number'],
-        'Loc.Absolute': loc,
-        'Loc.Relative': loc - prev_end,
-        'Loc.Percent': (loc - prev_end) / (nearest_exon['start'] - prev_end),
-    }
-
 
-def load_config_and_input_data(config_path):
-    """Load configuration file and input data
+    if motif_index_dir is None:
+        scanner = get_motif_scanner(*table_motifs(motifs_data))
+        motif_locs, motif_ids = scanner.scan(gene_data['sequence'][start: end])
+    else:
+        # Index keeps the hits on the whole gene sequence, only the ones inside the scanned region are used
+        index = get_motif_index(motif_index_dir, *table_motifs(motifs_data))
+        scanner = index.scanner
+        positions, motif_ids = index.hits(gene_data['gene_name'], gene_data['sequence'])
+        inside = (positions >= start) & (positions + scanner.lengths[motif_ids] <= end)
+        motif_locs, motif_ids = positions[inside] - start, motif_ids[inside]
+    motif_exons = find_nearest_exons(motif_locs, np.array(scanner.motifs, dtype=object)[motif_ids], variable_exons)
+
+    return motif_exons.merge(motifs_data[['Gene', 'Motif']], on='Motif').set_index('Gene')
+
+
+def find_nearest_exons(locs, motifs, exons):
+    """Exon containing each motif occurrence (`Exon`) or the next exon (`Intron`) and the relative location in it (exons are assumed not to overlap)"""
+    exons = exons.sort_values('start')
+    starts, ends = exons['start'].to_numpy(), exons['end'].to_numpy()
+    # Last exon starting at or before the location, the next one is the nearest exon for intron locations
+    prev = np.searchsorted(starts, locs, side='right') - 1
+    inside = (prev >= 0) & (locs <= ends[prev.clip(0)])
+    nearest = np.where(inside, prev, prev + 1)
+    # Locations after the last exon have no nearest exon
+    found = nearest < len(starts)
+    locs, motifs, inside, nearest = locs[found], motifs[found], inside[found], nearest[found]
+
+    prev_end = np.where(nearest > 0, ends[(nearest - 1).clip(0)], 0)
+    region_start = np.where(inside, starts[nearest], prev_end)
+    region_end = np.where(inside, ends[nearest], starts[nearest])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        loc_percent = (locs - region_start) / (region_end - region_start)
+
+    return pd.DataFrame({
+        'Pos': np.where(inside, 'Exon', 'Intron'),
+        'Number': exons['exon_number'].to_numpy()[nearest],
+        'Loc.Absolute': locs,
+        'Loc.Relative': locs - region_start,
+        'Loc.Percent': loc_percent,
+        'Motif': motifs,
+    })
+
+
+def resolve_path(config_dirname, path):
+    return os.path.join(config_dirname, path) if path else None
+
+
+def load_config(config_path):
+    """Load configuration file
     Parameters
     ----------
     config_path : string
         Path to config file (json).
     Returns
     -------
-    dict, dict, pd.DataFrame, pd.DataFrame, pd.DataFrame
+    dict, string
     """
     #
-    print('Loading config...')
+    logger.info('Loading config...')
     try:
         config_file = open(config_path, 'r')
         config = json.load(config_file)
     except:
-        print('Cannot open configuration file', file=sys.stderr)
+        logger.error('Cannot open configuration file %s', config_path)
+        sys.exit(1)
+    #
+    unknown_params = sorted(set(config.get('elastic_net', {})) - set(elastic_net_params))
+    if unknown_params:
+        logger.error('Unknown elastic_net parameters %s in %s, expected some of %s', unknown_params, config_path, elastic_net_params)
         sys.exit(1)
     #
     # Paths are absolute or relative to config file
     config_dirname = os.path.dirname(config_path)
+    # Motif index is shared by `srpseq index` and `srpseq build`, which may run from other directories
+    if config.get('motif_index_dir'):
+        config['motif_index_dir'] = resolve_path(config_dirname, config['motif_index_dir'])
+    return config, config_dirname
+
+
+def load_pwms(path, threshold=0.8):
+    """RBP position weight matrices of a MEME file (RBP is the motif name), rows of the motifs table"""
+    return pd.DataFrame([
+        {'Gene': name, 'Motif': motif_id, 'PWM': pwm, 'Threshold': threshold}
+        for motif_id, name, pwm in read_meme(path)
+    ], columns=['Gene', 'Motif', 'PWM', 'Threshold'])
+
+
+def load_motifs(config, config_dirname):
+    """RBP motifs table: `Gene` and `Motif` (nucleotides or IUPAC codes) columns, PWMs have `PWM` and `Threshold`"""
+    rbps_path = resolve_path(config_dirname, config.get('rbps_path'))
+    if rbps_path and os.path.isfile(rbps_path):
+        rbps = pd.read_csv(rbps_path, sep='\t', index_col=0)
+    else:
+        rbps = load_rbps()
+
+    pwms_path = resolve_path(config_dirname, config.get('pwms_path'))
+    if pwms_path:
+        rbps = pd.concat([rbps, load_pwms(pwms_path, threshold=config.get('pwm_threshold', 0.8))], ignore_index=True)
+
+    return rbps
+
+
+def load_shared_data(config, config_dirname):
+    """Load input data which is common for all genes
+    Parameters
+    ----------
+    config : dict
+        Configuration.
+    config_dirname : string
+        Directory of the config file.
+    Returns
+    -------
+    pd.DataFrame, pd.DataFrame
+    """
+    #
+    rbps = load_motifs(config, config_dirname)
     #
-    gene = config['gene']
-    if config.get('rbp_data_path') and os.path.isfile(config['rbp_data_path']):
-        rbp_df = pd.read_csv(os.path.join(config_dirname, config['rbp_data_path']), sep='\t', index_col=0)
+    # Only RBPs of the motif table (and sample annotations) are read from the expression table
+    columns = None
+    if config.get('rbps_from_motifs', True):
+        columns = set(rbps['Gene']) | set(muted_columns) | {'Cancer'}
+    rbp_data_path = resolve_path(config_dirname, config.get('rbp_data_path'))
+    if rbp_data_path and os.path.exists(rbp_data_path):
+        rbp_df = read_table(rbp_data_path, columns=columns)
     else:
-        rbp_df = load_rbp_data()
+        rbp_df = load_rbp_data(columns=columns)
     rbp_df = filter_columns_by_expression(
         rbp_df,
         tresh_mean=config.get('rbps_tresh_mean', 1),
         tresh_var=config.get('rbps_tresh_var', 3),
     ).rename(columns={'Cancer': 'Tissue'})
+    # Expression is stored in `dtype` (float32 by default), solver and scores upcast to float64
+    rbp_df = rbp_df.astype({col: config.get('dtype', 'float32') for col in rbp_df.columns if col not in muted_columns}, copy=False)
     #
-    if config.get('isoforms_data_path') and os.path.isfile(config['isoforms_data_path']):
-        isoforms_df = pd.read_csv(os.path.join(config_dirname, config['isoforms_data_path']), sep='\t', index_col=0)
+    return rbp_df, rbps
+
+
+def load_gene_input_data(config, config_dirname, gene, rbp_df):
+    """Load gene specific input data and align it with the RBP expression table
+    Parameters
+    ----------
+    config : dict
+        Configuration.
+    config_dirname : string
+        Directory of the config file.
+    gene : string
+        Gene name.
+    rbp_df : pd.DataFrame
+        RBP expression table loaded by `load_shared_data`.
+    Returns
+    -------
+    dict, pd.DataFrame, pd.DataFrame
+    """
+    #
+    isoforms_data_path = resolve_path(config_dirname, config.get('isoforms_data_path'))
+    if isoforms_data_path and os.path.exists(isoforms_data_path):
+        isoforms_df = read_table(isoforms_data_path)
     else:
         isoforms_df = load_isoforms(gene)
     isoforms_df = filter_columns_by_expression(
@@ -237,21 +378,38 @@ def load_config_and_input_data(config_path):
         tresh_mean=config.get('isoforms_tresh_mean', 1),
         tresh_var=config.get('isoforms_tresh_var', 10),
     )
-    if config.get('rbps_path') and os.path.isfile(config['rbps_path']):
-        rbps = pd.read_csv(os.path.join(config_dirname, config['rbps_path']), sep='\t', index_col=0)
-    else:
-        rbps = load_rbps()
+    isoforms_df = isoforms_df.astype({col: config.get('dtype', 'float32') for col in isoforms_df.select_dtypes('number').columns}, copy=False)
     #
     rbp_df, isoforms_df = intersect_dfs([rbp_df, isoforms_df])
     #
     gene_data = load_data(gene)
     gene_data['transcripts'] = [t for t in gene_data['transcripts'] if t['transcript_id'] in isoforms_df.columns]
     gene_data = set_variable_exons(gene_data)
-    gene_data['sequence'] = gene_data['sequence'].replace('T', 'U')
+    gene_data['sequence'] = rna_sequence(gene_data['sequence'])
+    #
+    return gene_data, rbp_df, isoforms_df
+
+
+def load_config_and_input_data(config_path, shared_data=None):
+    """Load configuration file and input data
+    Parameters
+    ----------
+    config_path : string
+        Path to config file (json).
+    shared_data : tuple, optional
+        RBP expression and motifs tables loaded by `load_shared_data` beforehand.
+    Returns
+    -------
+    dict, dict, pd.DataFrame, pd.DataFrame, pd.DataFrame
+    """
+    #
+    config, config_dirname = load_config(config_path)
+    rbp_df, rbps = shared_data if shared_data is not None else load_shared_data(config, config_dirname)
+    gene_data, rbp_df, isoforms_df = load_gene_input_data(config, config_dirname, config['gene'], rbp_df)
     #
     config['output_dir'] = make_sure_dir_exists(os.path.join(config_dirname, config['output_dir']))
     copyfile(config_path, os.path.join(config['output_dir'], 'config.json'))
     #
-    print('Loaded config...')
+    logger.info('Loaded config...')
     #
-    return config, gene_data, rbp_df.astype({col: np.float64 for col in rbp_df.columns if col not in muted_columns}), isoforms_df, rbps
+    return config, gene_data, rbp_df, isoforms_df, rbps
@@ -1,18 +1,25 @@
-import cv2 as cv
+import json
+
+import matplotlib
+matplotlib.use('Agg')
 import networkx as nx
+import seaborn as sns
 from matplotlib import pyplot as plt
-from networkx.drawing.nx_agraph import write_dot, graphviz_layout
+from networkx.drawing.nx_agraph import graphviz_layout
 from dna_features_viewer import GraphicFeature, GraphicRecord
 
 from src.consts import exon_len, intron_len
+from src.utils.common import aggregated_score, make_sure_dir_exists
 
 
 def plot_gene_isoforms(gene_data, output_dir):
     gene = gene_data['gene_name']
     seq_len = exon_len * len(gene_data['exon_numbers']) + intron_len * (len(gene_data['exon_numbers']) - 1)
+    transcripts = sorted(gene_data['transcripts'], key=lambda x: x['exon_numbers'], reverse=True)
 
-    imgs = []
-    for j, transcript in enumerate(sorted(gene_data['transcripts'], key=lambda x: x['exon_numbers'], reverse=True)):
+    # All isoforms are drawn as subplots of a single figure
+    fig, axes = plt.subplots(len(transcripts), 1, figsize=(20, 2 * len(transcripts)), squeeze=False)
+    for j, (transcript, ax) in enumerate(zip(transcripts, axes[:, 0])):
         exon_records = [
             GraphicFeature(
                 start=(exon_len + intron_len) * max(0, exon - 1),
@@ -26,50 +33,127 @@ def plot_gene_isoforms(gene_data, output_dir):
         ]
         #
         record = GraphicRecord(sequence_length=seq_len, features=exon_records, feature_level_height=0)
-        fig, ax = plt.subplots(1, 1, figsize=(20, 2))
         record.plot(ax=ax, figure_width=40)
         ax.set_xticklabels([])
         ax.set_title(f'Isoform {j + 1}', loc='left')
-        plt.savefig(f'{output_dir}/{gene}_isoform_{j}.png', bbox_inches='tight', dpi=500)
-        plt.close()
-        imgs.append(cv.imread(f'{output_dir}/{gene}_isoform_{j}.png'))
 
-    imgs = cv.vconcat(imgs)
-    cv.imwrite(f'{output_dir}/{gene}_isoforms.png', imgs)
+    fig.savefig(f'{output_dir}/{gene}_isoforms.png', bbox_inches='tight', dpi=300)
+    plt.close(fig)
 
 
-def plot_isoforms_tree(tree, output_dir):
+def plot_isoforms_tree(tree_df, output_dir):
+    """Plot the isoforms tree from the `tree` rows of the results table"""
     G = nx.DiGraph()
 
     node_labels = {}
     edge_labels = {}
 
-    parents = [tree]
-    lvl = 0
-    while len(parents):
-        cur_parents = []
-        for node_id, parent in enumerate(parents):
-            parent_transcripts = parent.kwargs
-            node_index = f'{lvl}_{node_id}'
-            parent.node_id = node_index
-            G.add_node(node_index)
-            node_labels[node_index] = '\n'.join([t['transcript_id'] for t in parent_transcripts])
-
-            if lvl > 0:
-                G.add_edge(parent.parent.node_id, node_index)
-                edge_labels[(parent.parent.node_id, node_index)] = f'{parent.divider_exon}'
-
-            if parent.left_child is not None:
-                cur_parents += [parent.left_child, parent.right_child]
-
-        parents = cur_parents
-        lvl += 1
+    tree = tree_df.pivot(index='node', columns='name', values='text')
+    divider_exons = tree_df[tree_df['name'] == 'divider_exon'].set_index('node')['value']
+    paths = sorted(tree.index, key=lambda path: (path.count('/'), path))
+    for path in paths:
+        parent = path.rsplit('/', 1)[0] if '/' in path else ''
+        if parent not in node_labels:
+            G.add_node(parent)
+            node_labels[parent] = '\n'.join(json.loads(tree.loc[path, 'parent_transcripts']))
+        G.add_node(path)
+        node_labels[path] = '\n'.join(json.loads(tree.loc[path, 'transcripts']))
+        G.add_edge(parent, path)
+        edge_labels[(parent, path)] = f'{int(divider_exons[path])}'
 
-    plt.figure(figsize=(12, 12))
+    fig = plt.figure(figsize=(12, 12))
     plt.title('Isoforms tree')
     pos = graphviz_layout(G, prog='dot')
     nx.draw(G, pos, labels=node_labels, with_labels=True, arrows=True, node_size=20000)
     nx.draw_networkx_nodes(G, pos)
     nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels)
     plt.tight_layout()
-    plt.savefig(f'{output_dir}/isoforms_tree.png', dpi=300)
+    fig.savefig(f'{output_dir}/isoforms_tree.png', dpi=300)
+    plt.close(fig)
+
+
+def plot_scores(results, tissues, output_dir):
+    """Plot accumulative accuracy scores of the leaf isoforms over their fractions distributions"""
+    fractions = results[results['table'] == 'fractions']
+    if fractions.empty:
+        return
+
+    fractions = fractions.pivot(index='node', columns='name', values='value')
+    tree = results[results['table'] == 'tree']
+    # Leaves in the breadth-first order of the tree
+    leaves = sorted(fractions.index, key=lambda path: (path.count('/'), path))
+    names = {
+        path: json.loads(text)[0]
+        for path, text in tree[tree['name'] == 'transcripts'].set_index('node')['text'].items()
+        if path in leaves
+    }
+    scores = results[results['table'] == 'scores'].set_index(['node', 'tissue', 'split', 'name'])['value'].sort_index()
+    variances = results[results['table'] == 'isoforms'].set_index(['node', 'tissue', 'split'])['value']
+
+    transcript_accuracies = {}
+    for path in leaves:
+        transcript_accuracies[names[path]] = {
+            split: scores[path, '', f'{split}.accumulative'].to_dict() for split in ['train', 'validation']
+        }
+        transcript_accuracies[names[path]]['tissue'] = {
+            tissue: {
+                **{split: scores[path, tissue, f'{split}.accumulative'].to_dict() for split in ['train', 'validation']},
+                **{f'var.{split}': variances[path, tissue, split] for split in ['train', 'validation']},
+            } for tissue in tissues
+        }
+    boxes = [{**fractions.loc[path].to_dict(), 'label': names[path]} for path in leaves]
+
+    make_sure_dir_exists(f'{output_dir}/scores/')
+    for score in ['cor', 'mds']:
+        fig = plt.figure(figsize=(8, 6))
+        bx = plt.gca()
+        bx.bxp(boxes, positions=range(len(boxes)), showfliers=False)
+        ax2 = bx.twinx()
+        sns.scatterplot(
+            x=transcript_accuracies.keys(),
+            y=[transcript_accuracies[iso]['validation'][score] for iso in transcript_accuracies],
+            color='blue', s=200, ax=ax2,
+        )
+        sns.scatterplot(
+            x=transcript_accuracies.keys(),
+            y=[transcript_accuracies[iso]['train'][score] for iso in transcript_accuracies],
+            color='red', s=200, ax=ax2,
+        )
+        ax2.legend(['Validation', 'Training'])
+        bx.set_xticklabels(bx.get_xticklabels(), rotation=90)
+        ax2.set_xticklabels(bx.get_xticklabels(), rotation=90)
+        ax2.set_ylim(0, 1)
+        bx.set_ylim(0, 1)
+        plt.grid(visible=True)
+        plt.tight_layout()
+        fig.savefig(f'{output_dir}/scores/{score}.png', dpi=300)
+        plt.close(fig)
+
+        if tissues:
+            tissue_scores = [aggregated_score(transcript_accuracies, tissue) for tissue in tissues]
+            fig = plt.figure(figsize=(8, 6))
+            ax = sns.scatterplot(
+                x=list(tissues),
+                y=[s['validation'][score] for s in tissue_scores],
+                color='blue', s=200,
+            )
+            sns.scatterplot(
+                x=list(tissues),
+                y=[s['train'][score] for s in tissue_scores],
+                color='red', s=200, ax=ax,
+            )
+            ax.legend(['Validation', 'Training'])
+            plt.xticks(rotation=90)
+            ax.set_ylim(0, 1)
+            plt.grid(visible=True)
+            plt.tight_layout()
+            fig.savefig(f'{output_dir}/scores/by_tissue.{score}.png', dpi=300)
+            plt.close(fig)
+
+
+def plot_results(results, metadata, output_dir):
+    results = results.astype({c: object for c in results.columns if c != 'value'})
+    if metadata.get('gene_structure'):
+        plot_gene_isoforms(metadata['gene_structure'], output_dir)
+    plot_scores(results, metadata.get('tissues', []), output_dir)
+    plot_isoforms_tree(results[results['table'] == 'tree'], output_dir)
@@ -0,0 +1,100 @@
+import json
+
+import pandas as pd
+
+from src.tree import iter_nodes
+
+
+results_columns = ['gene', 'node', 'tissue', 'table', 'name', 'split', 'value', 'text']
+
+
+def node_records(gene, node, tissue, res):
+    path = node.path
+    if res.get('coefs') is not None:
+        for name, estimate in res['coefs']['Estimate'].items():
+            yield gene, path, tissue, 'coefs', name, '', float(estimate), ''
+    for split, scores in (res.get('accuracy') or {}).items():
+        for name, value in scores.items():
+            yield gene, path, tissue, 'scores', name, split, float(value), ''
+
+
+def make_results_table(gene, tree):
+    records = []
+    for node in iter_nodes(tree):
+        records += [
+            (gene, node.path, '', 'tree', 'transcripts', '', float('nan'), json.dumps([t['transcript_id'] for t in node.kwargs])),
+            (gene, node.path, '', 'tree', 'parent_transcripts', '', float('nan'), json.dumps([t['transcript_id'] for t in node.parent.kwargs])),
+            (gene, node.path, '', 'tree', 'divider_exon', '', float(node.divider_exon), ''),
+        ]
+        records += list(node_records(gene, node, '', node.res))
+        for tissue, res in node.tissue_res.items():
+            records += list(node_records(gene, node, tissue, res))
+
+    return pd.DataFrame.from_records(records, columns=results_columns)
+
+
+def boxplot_stats(values):
+    """Quartiles and whiskers (the most extreme values within 1.5 IQR of the quartiles) of the values"""
+    values = values.dropna()
+    q1, med, q3 = values.quantile([.25, .5, .75])
+    iqr = q3 - q1
+    return {
+        'whislo': values[values >= q1 - 1.5 * iqr].min(),
+        'q1': q1,
+        'med': med,
+        'q3': q3,
+        'whishi': values[values <= q3 + 1.5 * iqr].max(),
+    }
+
+
+def make_isoforms_table(gene, tree, isoforms_df, index, split_rows, tissue_rows):
+    """Leaf isoforms fractions distributions and expression variances of every split (used for plots)
+
+    Split and tissue rows are positions in `index` (samples of the feature matrices). Fractions of the samples
+    are not stored, only the boxplot statistics of their distributions
+    """
+    leaves = [node for node in iter_nodes(tree) if node.left_child is None]
+    transcripts = [node.kwargs[0]['transcript_id'] for node in leaves]
+    fractions = isoforms_df[transcripts].div(isoforms_df[transcripts].sum(axis=1), axis=0)
+    records = []
+    for node, transcript in zip(leaves, transcripts):
+        expression = isoforms_df[transcript].reindex(index)
+        for split, rows in split_rows.items():
+            records.append((gene, node.path, '', 'isoforms', 'var', split, float(expression.iloc[rows].var()), ''))
+            for tissue, rows in tissue_rows[split].items():
+                records.append((gene, node.path, tissue, 'isoforms', 'var', split, float(expression.iloc[rows].var()), ''))
+        for name, value in boxplot_stats(fractions[transcript]).items():
+            records.append((gene, node.path, '', 'fractions', name, '', float(value), ''))
+
+    return pd.DataFrame.from_records(records, columns=results_columns)
+
+
+def make_stability_table(gene, stability):
+    """Stability statistics of the node coefficients (`split` is the statistic) and held-out scores of every replicate (`split` is the replicate number)"""
+    coefficients = stability['coefficients'].melt(id_vars=['node', 'name'], var_name='split')
+    scores = stability['scores'].melt(id_vars=['node', 'replicate'], var_name='name')
+    return pd.concat([
+        coefficients.assign(gene=gene, tissue='', table='stability', text='')[results_columns],
+        scores.assign(gene=gene, tissue='', table='stability_scores', text='', split=scores['replicate'].astype(str))[results_columns],
+    ], ignore_index=True)
+
+
+def write_results(path, results, metadata):
+    """Save long-format results table to a single parquet file, `metadata` goes to the file schema"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    for c in results_columns:
+        if c != 'value':
+            results[c] = results[c].astype('category')
+    table = pa.Table.from_pandas(results, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, b'srpseq': json.dumps(metadata).encode()})
+    pq.write_table(table, path, compression='zstd')
+
+
+def read_results(path, filters=None):
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path, filters=filters)
+    metadata = json.loads(table.schema.metadata.get(b'srpseq', b'{}'))
+    return table.to_pandas(), metadata
@@ -0,0 +1,73 @@
+import os
+import sys
+import logging
+import multiprocessing as mp
+
+from src.build import load_genes
+from src.helpers.motif_index import get_motif_index
+from src.helpers.pipeline import load_config, load_data, load_motifs, rna_sequence
+from src.utils.motifs import table_motifs
+
+
+logger = logging.getLogger(__name__)
+
+
+# Motif index of the workers (inherited on fork)
+_shared = {}
+
+
+def init_worker(index_dir, motifs):
+    _shared.update(index_dir=index_dir, motifs=motifs)
+
+
+def index_gene(gene):
+    """Scan the gene sequence and save its motif hits, unless they are already indexed"""
+    try:
+        index = get_motif_index(_shared['index_dir'], *_shared['motifs'])
+        sequence = rna_sequence(load_data(gene)['sequence'])
+        if index.load(gene, sequence) is not None:
+            return gene, 'exists'
+        index.save(gene, sequence, *index.scanner.scan(sequence))
+        return gene, 'indexed'
+    except Exception:
+        logger.exception('%s failed', gene)
+        return gene, 'failed'
+
+
+def main(config_path, genes_path=None, n_processes=None):
+    config, config_dirname = load_config(config_path)
+    if not config.get('motif_index_dir'):
+        logger.error('Please specify motif_index_dir in the configuration file')
+        sys.exit(1)
+
+    if genes_path is not None:
+        genes = load_genes(genes_path)
+    else:
+        genes = config.get('genes') or ([config['gene']] if config.get('gene') else [])
+    genes = list(dict.fromkeys(genes))
+    if not genes:
+        logger.error('No genes to index, please specify a genes file or genes / gene in the configuration file')
+        sys.exit(1)
+    motifs = table_motifs(load_motifs(config, config_dirname))
+    logger.info('Indexing %d genes (%d motifs, %d PWMs) in %s...', len(genes), len(set(motifs[0])), len(motifs[1]), config['motif_index_dir'])
+
+    n_processes = min(n_processes or config.get('n_processes', os.cpu_count()), len(genes))
+    ctx = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else mp.get_context()
+    statuses = {'indexed': 0, 'exists': 0, 'failed': 0}
+    with ctx.Pool(n_processes, initializer=init_worker, initargs=(config['motif_index_dir'], motifs)) as pool:
+        for i, (gene, status) in enumerate(pool.imap_unordered(index_gene, genes), 1):
+            statuses[status] += 1
+            logger.debug('[%d/%d] %s: %s', i, len(genes), gene, status)
+            if i % 100 == 0:
+                logger.info('[%d/%d] %s', i, len(genes), ', '.join(f'{k}: {v}' for k, v in statuses.items()))
+
+    logger.info('Finished: %s', ', '.join(f'{k}: {v}' for k, v in statuses.items()))
+    return statuses
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Please specify configuration file', file=sys.stderr)
+        sys.exit(1)
+
+    main(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,329 @@
+"""Local job queue: `srpseq queue` adds configuration files to a SQLite queue, `srpseq worker` runs them
+
+A worker loads the shared input data (RBP expression and motifs tables) once for all jobs with the same inputs
+and runs every job in a forked process, so jobs share the loaded tables instead of reloading them.
+New jobs start while there are free slots and enough available memory for the peak memory of the finished jobs.
+Failed jobs are retried up to `max_attempts` times.
+"""
+import os
+import sys
+import time
+import socket
+import sqlite3
+import logging
+import traceback
+import multiprocessing as mp
+from collections import OrderedDict
+from multiprocessing.connection import wait
+
+import pandas as pd
+
+from src import build
+from src.helpers.checkpoints import fingerprint
+from src.helpers.pipeline import load_config, load_shared_data, resolve_path
+from src.utils.profiler import max_rss_mb
+
+
+logger = logging.getLogger(__name__)
+
+default_db_path = 'srpseq_jobs.sqlite'
+
+# Configuration keys defining the shared input data (see `load_shared_data`)
+shared_data_keys = [
+    'rbp_data_path', 'rbps_path', 'pwms_path', 'pwm_threshold', 'rbps_from_motifs', 'rbps_tresh_mean', 'rbps_tresh_var', 'dtype',
+]
+
+
+def connect(db_path=default_db_path):
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            config_path TEXT NOT NULL,
+            genes_path TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            worker TEXT,
+            submitted REAL,
+            started REAL,
+            finished REAL,
+            time REAL,
+            max_rss_mb REAL,
+            error TEXT
+        )
+    ''')
+    return conn
+
+
+def add_jobs(db_path, config_paths, genes_path=None, max_attempts=3):
+    conn = connect(db_path)
+    with conn:
+        ids = [
+            conn.execute(
+                'INSERT INTO jobs (config_path, genes_path, max_attempts, submitted) VALUES (?, ?, ?, ?)',
+                (os.path.abspath(path), os.path.abspath(genes_path) if genes_path else None, max_attempts, time.time()),
+            ).lastrowid
+            for path in config_paths
+        ]
+    conn.close()
+    logger.info('Added %d jobs to %s', len(ids), db_path)
+    return ids
+
+
+def claim_job(conn, worker):
+    """Mark the first pending job as running by `worker` and return it (None if there are no pending jobs)"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        job = conn.execute("SELECT * FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+        if job is not None:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started = ?, finished = NULL, attempts = attempts + 1 WHERE id = ?",
+                (worker, time.time(), job['id']),
+            )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+    return dict(job, attempts=job['attempts'] + 1) if job is not None else None
+
+
+def finish_job(conn, job, error='', elapsed=None, rss=None, failed=False):
+    """Record the job result, failed jobs go back to the queue until they run out of attempts"""
+    status = 'done'
+    if failed:
+        status = 'pending' if job['attempts'] < job['max_attempts'] else 'failed'
+    conn.execute(
+        'UPDATE jobs SET status = ?, finished = ?, time = ?, max_rss_mb = ?, error = ? WHERE id = ?',
+        (status, time.time(), elapsed, rss, error, job['id']),
+    )
+    return status
+
+
+def requeue_stale(conn):
+    """Return running jobs of dead workers of this host to the queue"""
+    host = socket.gethostname()
+    for job in conn.execute("SELECT * FROM jobs WHERE status = 'running'").fetchall():
+        worker_host, _, pid = (job['worker'] or '').rpartition(':')
+        if worker_host == host and pid.isdigit() and not pid_exists(int(pid)):
+            finish_job(conn, dict(job), error='worker died', failed=True)
+            logger.warning('Job %d of a dead worker %s is returned to the queue', job['id'], job['worker'])
+
+
+def retry_failed(db_path):
+    conn = connect(db_path)
+    n = conn.execute("UPDATE jobs SET status = 'pending', attempts = 0 WHERE status = 'failed'").rowcount
+    conn.close()
+    logger.info('%d failed jobs are returned to the queue', n)
+    return n
+
+
+def jobs_status(db_path):
+    conn = connect(db_path)
+    jobs = pd.read_sql_query('SELECT * FROM jobs ORDER BY id', conn, index_col='id')
+    conn.close()
+    return jobs
+
+
+def pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def mem_available_mb():
+    """Memory available for new processes (MemAvailable of /proc/meminfo), None if it is not known"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    return None
+
+
+def process_rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    return None
+
+
+def shared_data_key(config, config_dirname):
+    """Hash of the shared inputs of the config: options, paths and modification times of the input files"""
+    paths = [resolve_path(config_dirname, config.get(key)) for key in ['rbp_data_path', 'rbps_path', 'pwms_path']]
+    return fingerprint(
+        {key: config.get(key) for key in shared_data_keys},
+        [(os.path.abspath(path), os.path.getmtime(path)) if path and os.path.exists(path) else None for path in paths],
+    )
+
+
+def run_job(job, shared_data, connection):
+    """Run the job in a forked worker process and send its result to the parent"""
+    start = time.time()
+    error, failed = '', False
+    try:
+        statuses = build.main(job['config_path'], job['genes_path'], shared_data=shared_data)
+        if isinstance(statuses, pd.DataFrame) and (statuses['status'] != 'ok').any():
+            # Failed genes of a batch are reported in its status.tsv, the batch is not re-run
+            error = f"{(statuses['status'] != 'ok').sum()} of {len(statuses)} genes failed"
+    except (Exception, SystemExit):
+        failed = True
+        error = traceback.format_exc().strip().split('\n')[-1]
+        logger.exception('Job %d failed', job['id'])
+    connection.send({'error': error, 'failed': failed, 'time': time.time() - start, 'max_rss_mb': max_rss_mb()})
+    connection.close()
+
+
+class Worker:
+    """Runs jobs of the queue in forked processes, at most `processes` at a time
+
+    A job starts if the available memory minus `min_free_mb` fits the memory of a job (`job_memory_mb`, by default
+    the largest memory increase over the shared data of the finished jobs) and the expected growth of the running ones.
+    Without `job_memory_mb`, jobs run one at a time until the first one finishes and gives the estimate.
+    """
+
+    def __init__(self, db_path=default_db_path, processes=1, job_memory_mb=None, min_free_mb=1024, cached_inputs=1, poll=5):
+        self.conn = connect(db_path)
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.processes = processes
+        self.job_memory_mb = job_memory_mb or 0
+        self.estimate_memory = job_memory_mb is None
+        self.min_free_mb = min_free_mb
+        self.cached_inputs = cached_inputs
+        self.poll = poll
+        self.inputs = OrderedDict()
+        self.running = {}
+        self.ctx = mp.get_context('fork')
+
+    def shared_data(self, job):
+        """Shared input data of the job config, loaded once for all jobs with the same inputs"""
+        config, config_dirname = load_config(job['config_path'])
+        key = shared_data_key(config, config_dirname)
+        if key not in self.inputs:
+            logger.info('Loading shared data of %s...', job['config_path'])
+            self.inputs[key] = load_shared_data(config, config_dirname)
+            # Running jobs keep their (forked) copies of the evicted data
+            while len(self.inputs) > self.cached_inputs:
+                self.inputs.popitem(last=False)
+        self.inputs.move_to_end(key)
+        return self.inputs[key]
+
+    def has_memory(self):
+        if not self.running:
+            return True
+        if self.estimate_memory and not self.job_memory_mb:
+            # Memory of a job is not known yet
+            return False
+        available = mem_available_mb()
+        if available is None:
+            return True
+        # Running jobs may still grow up to the job memory
+        growth = 0
+        for process, _, _, base_rss in self.running.values():
+            rss = process_rss_mb(process.pid)
+            growth += max(0, self.job_memory_mb - (rss - base_rss if rss is not None else 0))
+        return available - self.min_free_mb - growth >= self.job_memory_mb
+
+    def start(self, job):
+        try:
+            shared_data = self.shared_data(job)
+        except (Exception, SystemExit):
+            error = traceback.format_exc().strip().split('\n')[-1]
+            logger.exception('Cannot load the input data of job %d', job['id'])
+            finish_job(self.conn, job, error=error, failed=True)
+            return
+
+        reader, writer = self.ctx.Pipe(duplex=False)
+        process = self.ctx.Process(target=run_job, args=(job, shared_data, writer), name=f'job-{job["id"]}')
+        process.start()
+        writer.close()
+        self.running[job['id']] = (process, reader, job, max_rss_mb())
+        logger.info('Job %d started: %s', job['id'], job['config_path'])
+
+    def collect(self):
+        for job_id, (process, reader, job, base_rss) in list(self.running.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            try:
+                result = reader.recv()
+            except EOFError:
+                # The job process died before sending its result
+                result = {'error': f'exit code {process.exitcode}', 'failed': True, 'time': None, 'max_rss_mb': None}
+            reader.close()
+            del self.running[job_id]
+
+            status = finish_job(self.conn, job, error=result['error'], elapsed=result['time'], rss=result['max_rss_mb'], failed=result['failed'])
+            if self.estimate_memory and result['max_rss_mb'] is not None:
+                # Any positive estimate allows running jobs in parallel
+                estimate = max(self.job_memory_mb, result['max_rss_mb'] - base_rss, 1)
+                if estimate != self.job_memory_mb:
+                    self.job_memory_mb = estimate
+                    logger.info('Worker %s: job memory estimate %.0f MB', self.name, self.job_memory_mb)
+            logger.info('Job %d: %s %s', job_id, status, result['error'])
+
+    def run(self, exit_when_empty=False):
+        requeue_stale(self.conn)
+        if self.estimate_memory:
+            logger.info('Worker %s: %d processes, job memory is estimated from the first finished job', self.name, self.processes)
+        else:
+            logger.info('Worker %s: %d processes, job memory %.0f MB', self.name, self.processes, self.job_memory_mb)
+        try:
+            while True:
+                self.collect()
+                while len(self.running) < self.processes and self.has_memory():
+                    job = claim_job(self.conn, self.name)
+                    if job is None:
+                        break
+                    self.start(job)
+
+                if not self.running and exit_when_empty and not self.conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'pending'",
+                ).fetchone()[0]:
+                    break
+                # Wake up when a job finishes or to poll the queue
+                if self.running:
+                    wait([process.sentinel for process, _, _, _ in self.running.values()], timeout=self.poll)
+                else:
+                    time.sleep(self.poll)
+            logger.info('Worker %s: the queue is empty', self.name)
+        finally:
+            for process, _, _, _ in self.running.values():
+                process.join()
+            self.collect()
+
+
+def queue_main(action, db_path=default_db_path, config_paths=(), genes_path=None, max_attempts=3):
+    if action == 'add':
+        return add_jobs(db_path, config_paths, genes_path=genes_path, max_attempts=max_attempts)
+    if action == 'retry':
+        return retry_failed(db_path)
+
+    jobs = jobs_status(db_path)
+    if jobs.empty:
+        print('No jobs')
+        return jobs
+    print(jobs['status'].value_counts().to_string())
+    print(jobs[['config_path', 'status', 'attempts', 'worker', 'time', 'max_rss_mb', 'error']].to_string())
+    return jobs
+
+
+def worker_main(db_path=default_db_path, processes=1, job_memory_mb=None, min_free_mb=1024, exit_when_empty=False, poll=5):
+    if 'fork' not in mp.get_all_start_methods():
+        logger.error('Worker needs fork start method to share the loaded data with the jobs')
+        sys.exit(1)
+
+    Worker(db_path, processes=processes, job_memory_mb=job_memory_mb, min_free_mb=min_free_mb, poll=poll).run(exit_when_empty=exit_when_empty)
@@ -1,70 +1,73 @@
 from bio import *
-from sklearn.model_selection import GridSearchCV
-from sklearn.linear_model import ElasticNet, LinearRegression
+from sklearn.model_selection import KFold
+from sklearn.linear_model import ElasticNet, LinearRegression, enet_path
 
 from src.consts import muted_columns
-from src.helpers.model import prepare_model_data, get_accuracy, remove_outliers
-from src.utils.common import inlogit, logit
-
-
-def custom_score_grouped(groups):
-    def custom_score(model, X, y):
-        df = X.copy()
-        df['fraq'] = inlogit(y)
-        scores = get_accuracy(model, df, is_numpy=False)
-        return 0 if np.isnan(scores['cor']) else scores['cor']
-        # grouped = []
-        # for _, group in groups:
-        #     df = loc(X, group.index)
-        #     df['fraq'] = inlogit(loc(y, group.index))
-        #     scores = get_accuracy(model, df)
-        #     grouped.append(0 if np.isnan(scores['uplift']) else 1 / (1 + abs(scores['uplift'])))
-        #
-        # return np.median(grouped)
-    #
-    return custom_score
-
-
-def elastic_net(train, alpha=np.power(2.0, range(-5, 2)), l1_ratio=[1, 0.5, 0.1], **kwargs):
-    train_ = remove_outliers(train)
-    cols, train_X, train_Y = prepare_model_data(train_, is_numpy=False)
-    if train_Y.empty or np.var(inlogit(train_Y)) < 0.001:
-        model = LinearRegression()
-        model.coef_ = np.zeros(shape=(len(cols), ))
-        model.intercept_ = logit(np.median(train_['fraq']) if not train_.empty else train['fraq'].min())
-        coefs = pd.DataFrame({'(Intercept)': {'Estimate': model.intercept_, 'p-value': 0}}).T
-        return {
-            'coefs': coefs,
-            'cv': None,
-            'model': model,
-            'params': 'low variance',
-        }
-
-    custom_scorer = custom_score_grouped(train_.groupby(by='Tissue'))
-
-    cv = GridSearchCV(
-        estimator=ElasticNet(random_state=0),
-        cv=2,
-        param_grid={'alpha': alpha, 'l1_ratio': l1_ratio},
-        scoring=custom_scorer,
-    )
-    cv.fit(train_X, train_Y, sample_weight=train_['Freq'] if 'Freq' in train_.columns else None)
-    model = cv.best_estimator_
-    significant_inds = model.coef_ != 0
-    cols, train_X, train_Y = prepare_model_data(train_[set(list(np.array(cols)[significant_inds])+muted_columns)&set(train_.columns)], is_numpy=False)
+from src.helpers.model import inlier_rows, prepare_model_data
+from src.utils.common import inlogit, logit, pearson_columns
 
-    if not cols:
-        coefs = pd.DataFrame({'(Intercept)': {'Estimate': model.intercept_, 'p-value': 0}}).T
-        return {
-            'coefs': coefs,
-            'cv': None,
-            'model': model,
-            'params': 'low variance',
-        }
 
-    model = LinearRegression(**kwargs)
-    model.fit(train_X, train_Y, sample_weight=train_['Freq'])
+def center_data(X, y, sample_weight=None):
+    # Same preprocessing as ElasticNet.fit: weights rescaled to sum to n_samples, weighted centering, sqrt(w) row scaling
+    if sample_weight is None:
+        sample_weight = np.ones(len(y))
+    sample_weight = sample_weight * (len(y) / np.sum(sample_weight))
+    X_offset = np.average(X, axis=0, weights=sample_weight)
+    y_offset = np.average(y, weights=sample_weight)
+    sw_sqrt = np.sqrt(sample_weight)
+    return (X - X_offset) * sw_sqrt[:, None], (y - y_offset) * sw_sqrt, X_offset, y_offset
+
+
+def enet_path_search(X, y, sample_weight=None, alpha=np.power(2.0, range(-5, 2)), l1_ratio=[1, 0.5, 0.1], cv=2):
+    """Mean CV correlation for the (alpha, l1_ratio) grid, computed with warm-started ElasticNet paths"""
+    alphas = np.sort(np.asarray(alpha, dtype=np.float64))[::-1]
+    scores = np.zeros((len(alphas), len(l1_ratio)))
+    for train_index, test_index in KFold(n_splits=cv).split(X):
+        X_train, y_train, X_offset, y_offset = center_data(
+            X[train_index], y[train_index],
+            sample_weight[train_index] if sample_weight is not None else None,
+        )
+        # Gram matrix is shared by the paths of all l1_ratios
+        gram, xy = np.dot(X_train.T, X_train), np.dot(X_train.T, y_train)
+        for j, ratio in enumerate(l1_ratio):
+            _, coefs, _ = enet_path(X_train, y_train, l1_ratio=ratio, alphas=alphas, precompute=gram, Xy=xy)
+            predictions = np.dot(X[test_index], coefs) + (y_offset - np.dot(X_offset, coefs))
+            scores[:, j] += np.nan_to_num(pearson_columns(predictions, y[test_index][:, None]))
+
+    return pd.DataFrame(scores / cv, index=alphas, columns=l1_ratio)
+
+
+def is_low_variance(y):
+    return not len(y) or np.var(inlogit(y)) < 0.001
+
+
+def constant_model(n_features, fraq, rows):
+    """Model predicting the median fraction of the rows (the minimum fraction if there are no rows)"""
+    valid = fraq[~np.isnan(fraq)]
+    model = LinearRegression()
+    model.coef_ = np.zeros(shape=(n_features, ))
+    model.intercept_ = logit(np.median(fraq[rows]) if len(rows) else np.min(valid) if len(valid) else np.nan)
+    return model
+
 
+def intercept_only(model):
+    return {
+        'coefs': pd.DataFrame({'(Intercept)': {'Estimate': model.intercept_, 'p-value': 0}}).T,
+        'cv': None,
+        'model': model,
+        'params': 'low variance',
+    }
+
+
+def select_params(cv_scores, alpha, l1_ratio):
+    # First best candidate in the (alpha, l1_ratio) grid order, as GridSearchCV selects it
+    return max(
+        ({'alpha': a, 'l1_ratio': r} for a in alpha for r in l1_ratio),
+        key=lambda params: cv_scores.loc[params['alpha'], params['l1_ratio']],
+    )
+
+
+def model_result(model, cols, cv_scores, params):
     coefs = pd.DataFrame(model.coef_, index=cols)
     coefs.loc[:, 'p-value'] = 0
     coefs.loc['(Intercept)'] = [model.intercept_, 0]
@@ -72,7 +75,117 @@ def elastic_net(train, alpha=np.power(2.0, range(-5, 2)), l1_ratio=[1, 0.5, 0.1]
 
     return {
         'coefs': coefs,
-        'cv': cv,
+        'cv': cv_scores,
         'model': model,
-        'params': cv.best_params_,
+        'params': params,
     }
+
+
+def elastic_net(train, alpha=np.power(2.0, range(-5, 2)), l1_ratio=[1, 0.5, 0.1], cv=2):
+    # Features may be stored in reduced precision (see `dtype` config), models are always fitted in float64
+    train = train.astype({c: np.float64 for c in train.columns if c not in muted_columns})
+    fraq = train['fraq'].to_numpy(dtype=np.float64)
+    rows = inlier_rows(fraq)
+    train_ = train.iloc[rows]
+    cols, train_X, train_Y = prepare_model_data(train_, is_numpy=False)
+    if is_low_variance(train_Y):
+        return intercept_only(constant_model(len(cols), fraq, rows))
+
+    sample_weight = train_['Freq'].to_numpy() if 'Freq' in train_.columns else None
+    cv_scores = enet_path_search(
+        train_X.to_numpy(dtype=np.float64), train_Y.to_numpy(dtype=np.float64), sample_weight,
+        alpha=alpha, l1_ratio=l1_ratio, cv=cv,
+    )
+    best_params = select_params(cv_scores, alpha, l1_ratio)
+    model = ElasticNet(random_state=0, **best_params)
+    model.fit(train_X, train_Y, sample_weight=sample_weight)
+    significant_cols = set(np.array(cols)[model.coef_ != 0])
+    cols, train_X, train_Y = prepare_model_data(train_[[c for c in train_.columns if c in significant_cols or c in muted_columns]], is_numpy=False)
+
+    if not cols:
+        return intercept_only(model)
+
+    model = LinearRegression()
+    model.fit(train_X, train_Y, sample_weight=sample_weight)
+    return model_result(model, cols, cv_scores, best_params)
+
+
+def weighted_sums(X, y, sample_weight):
+    """Weighted sums of the rows: sum(w), X^T w, X^T W X, X^T W y and y^T w"""
+    wX = X * sample_weight[:, None]
+    return [np.sum(sample_weight), wX.sum(axis=0), np.dot(wX.T, X), np.dot(wX.T, y), np.dot(sample_weight, y)]
+
+
+def centered_gram(sums, n_samples):
+    # Gram matrix and X^T y of the data preprocessed by `center_data`, computed from `weighted_sums` of its rows
+    w, x_sum, xx, xy, y_sum = sums
+    X_offset, y_offset = x_sum / w, y_sum / w
+    scale = n_samples / w
+    return scale * (xx - np.outer(x_sum, X_offset)), scale * (xy - x_sum * y_offset), X_offset, y_offset
+
+
+def enet_gram_path(gram, xy, y, l1_ratio, alphas):
+    # Coordinate descent on the Gram matrix uses only the shape of X
+    X = np.broadcast_to(np.zeros(1), (len(y), len(xy)))
+    _, coefs, _ = enet_path(X, y, l1_ratio=l1_ratio, alphas=alphas, precompute=gram, Xy=xy, check_input=False)
+    return coefs
+
+
+def elastic_net_gram(X, fraq, columns, sample_weight=None, alpha=np.power(2.0, range(-5, 2)), l1_ratio=[1, 0.5, 0.1], cv=2):
+    """`elastic_net` computed from the sums of the CV folds rows, all paths and the OLS refit use only the Gram matrices"""
+    rows = inlier_rows(fraq)
+    y = logit(fraq[rows])
+    if is_low_variance(y):
+        return intercept_only(constant_model(len(columns), fraq, rows))
+
+    sample_weight = np.ones(len(rows)) if sample_weight is None else sample_weight[rows]
+    # Rows are shifted by their mean, so the sums are not dominated by the offsets
+    shift = np.average(X[rows], axis=0, weights=sample_weight)
+    X = X[rows] - shift
+    folds = list(KFold(n_splits=cv).split(X))
+    fold_sums = [weighted_sums(X[test_index], y[test_index], sample_weight[test_index]) for _, test_index in folds]
+    total = [sum(values) for values in zip(*fold_sums)]
+
+    alphas = np.sort(np.asarray(alpha, dtype=np.float64))[::-1]
+    scores = np.zeros((len(alphas), len(l1_ratio)))
+    for (train_index, test_index), sums in zip(folds, fold_sums):
+        # Sums of the training rows are the total without the test fold
+        train_sums = [t - s for t, s in zip(total, sums)]
+        gram, xy, X_offset, y_offset = centered_gram(train_sums, len(train_index))
+        y_train = (y[train_index] - y_offset) * np.sqrt(sample_weight[train_index] * len(train_index) / train_sums[0])
+        for j, ratio in enumerate(l1_ratio):
+            coefs = enet_gram_path(gram, xy, y_train, ratio, alphas)
+            predictions = np.dot(X[test_index], coefs) + (y_offset - np.dot(X_offset, coefs))
+            scores[:, j] += np.nan_to_num(pearson_columns(predictions, y[test_index][:, None]))
+    cv_scores = pd.DataFrame(scores / cv, index=alphas, columns=l1_ratio)
+
+    best_params = select_params(cv_scores, alpha, l1_ratio)
+    gram, xy, X_offset, y_offset = centered_gram(total, len(rows))
+    y_centered = (y - y_offset) * np.sqrt(sample_weight * len(rows) / total[0])
+    model = ElasticNet(random_state=0, **best_params)
+    model.coef_ = enet_gram_path(gram, xy, y_centered, best_params['l1_ratio'], [best_params['alpha']])[:, 0]
+    model.intercept_ = y_offset - np.dot(X_offset + shift, model.coef_)
+    support = np.flatnonzero(model.coef_)
+
+    if not len(support):
+        return intercept_only(model)
+
+    # OLS on the selected features from the normal equations (minimum norm solution, as lstsq on the rows)
+    model = LinearRegression()
+    model.coef_ = np.linalg.lstsq(gram[np.ix_(support, support)], xy[support], rcond=None)[0]
+    model.intercept_ = y_offset - np.dot(X_offset[support] + shift[support], model.coef_)
+
+    return model_result(model, columns[support], cv_scores, best_params)
+
+
+def elastic_net_groups(X, fraq, groups, columns, sample_weight=None, **kwargs):
+    """`elastic_net` of every group of rows (e.g. tissues) of the same feature matrix
+
+    The matrix is converted to float64 once and every model is fitted from the Gram matrices of its rows,
+    instead of a data frame per group.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    return [
+        elastic_net_gram(X[rows], fraq[rows], columns, None if sample_weight is None else sample_weight[rows], **kwargs)
+        for rows in groups
+    ]
@@ -0,0 +1,147 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from src.tree import iter_nodes
+from src.utils.common import coefs_matrix, inlogit
+
+
+class TreeModel:
+    """Trained isoform tree without data: topology, divider exons and coefficients of every node (and tissue)
+
+    Each node is stored as a logistic model p = inlogit(X @ weights + intercept), the right child of a split
+    uses the negated coefficients of its left sibling, as 1 - inlogit(z) = inlogit(-z).
+    """
+
+    format_version = 1
+
+    def __init__(self, gene, features, paths, parents, divider_exons, transcripts,
+                 weights, intercepts, tissues=(), tissue_weights=None, tissue_intercepts=None):
+        self.gene = gene
+        self.features = pd.Index(features)
+        self.paths = list(paths)
+        self.parents = np.asarray(parents)
+        self.divider_exons = np.asarray(divider_exons)
+        self.transcripts = list(transcripts)
+        self.weights = np.asarray(weights)
+        self.intercepts = np.asarray(intercepts)
+        self.tissues = list(tissues)
+        self.tissue_weights = np.zeros((0, ) + self.weights.shape) if tissue_weights is None else np.asarray(tissue_weights)
+        self.tissue_intercepts = np.zeros((0, len(self.paths))) if tissue_intercepts is None else np.asarray(tissue_intercepts)
+
+    @property
+    def leaves(self):
+        return np.setdiff1d(np.arange(len(self.paths)), self.parents)
+
+    @staticmethod
+    def nodes_coefs(nodes, coefs_list, features):
+        # Coefficients of left nodes, (n_features, n_left) -> (n_nodes, n_features) with negated right siblings
+        weights, intercepts = coefs_matrix(coefs_list, features)
+        all_weights = np.empty((len(nodes), len(features)))
+        all_weights[0::2], all_weights[1::2] = weights.T, -weights.T
+        all_intercepts = np.empty(len(nodes))
+        all_intercepts[0::2], all_intercepts[1::2] = intercepts, -intercepts
+
+        return all_weights, all_intercepts
+
+    @classmethod
+    def from_tree(cls, gene, tree, tissues=()):
+        nodes = list(iter_nodes(tree))
+        node_ids = {id(node): j for j, node in enumerate(nodes)}
+        tissues = sorted(tissues)
+
+        coefs_lists = [[node.res.get('coefs') for node in nodes[::2]]]
+        coefs_lists += [[node.tissue_res.get(tissue, {}).get('coefs') for node in nodes[::2]] for tissue in tissues]
+        used = set(name for coefs_list in coefs_lists for coefs in coefs_list if coefs is not None for name in coefs.index)
+        features = pd.Index([c for c in nodes[0].matrix.columns if c in used]) if nodes else pd.Index([])
+
+        weights, intercepts = cls.nodes_coefs(nodes, coefs_lists[0], features)
+        tissue_coefs = [cls.nodes_coefs(nodes, coefs_list, features) for coefs_list in coefs_lists[1:]]
+
+        return cls(
+            gene=gene,
+            features=features,
+            paths=[node.path for node in nodes],
+            parents=[node_ids.get(id(node.parent), -1) for node in nodes],
+            divider_exons=[node.divider_exon for node in nodes],
+            transcripts=[[t['transcript_id'] for t in node.kwargs] for node in nodes],
+            weights=weights,
+            intercepts=intercepts,
+            tissues=tissues,
+            tissue_weights=np.array([w for w, _ in tissue_coefs]).reshape((len(tissues), len(nodes), len(features))),
+            tissue_intercepts=np.array([b for _, b in tissue_coefs]).reshape((len(tissues), len(nodes))),
+        )
+
+    def leaf_names(self):
+        return [','.join(self.transcripts[j]) for j in self.leaves]
+
+    def predict_nodes(self, df, by_tissue=False):
+        """Probabilities of all nodes and their products along root-to-node paths for samples x features `df`"""
+        missing = self.features.difference(df.columns)
+        if len(missing):
+            raise ValueError(f'Features {", ".join(missing[:10])}{"..." if len(missing) > 10 else ""} are missing for {self.gene} model.')
+        x = df[self.features].to_numpy()
+        # float32 input is kept as is, logits are float64 anyway (weights are float64)
+        if x.dtype.kind != 'f':
+            x = x.astype(np.float64)
+
+        logits = np.dot(x, self.weights.T) + self.intercepts
+        if by_tissue and self.tissues and 'Tissue' in df.columns:
+            sample_tissues = df['Tissue'].to_numpy()
+            for t, tissue in enumerate(self.tissues):
+                rows = np.flatnonzero(sample_tissues == tissue)
+                if len(rows):
+                    logits[rows] = np.dot(x[rows], self.tissue_weights[t].T) + self.tissue_intercepts[t]
+        predictions = inlogit(logits)
+
+        accumulative = np.empty_like(predictions)
+        for j, parent in enumerate(self.parents):
+            accumulative[:, j] = predictions[:, j] if parent < 0 else accumulative[:, parent] * predictions[:, j]
+
+        return predictions, accumulative
+
+    def predict(self, df, by_tissue=False):
+        """Fraction of every leaf isoform (group) for samples x features `df`"""
+        _, accumulative = self.predict_nodes(df, by_tissue=by_tissue)
+        return pd.DataFrame(accumulative[:, self.leaves], index=df.index, columns=self.leaf_names())
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                format_version=self.format_version,
+                meta=json.dumps({
+                    'gene': self.gene,
+                    'paths': self.paths,
+                    'transcripts': self.transcripts,
+                    'tissues': self.tissues,
+                }),
+                features=np.array(self.features, dtype=str),
+                parents=self.parents,
+                divider_exons=self.divider_exons,
+                weights=self.weights,
+                intercepts=self.intercepts,
+                tissue_weights=self.tissue_weights,
+                tissue_intercepts=self.tissue_intercepts,
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data['format_version']) > cls.format_version:
+                raise ValueError(f'Model {path} has unsupported format version {int(data["format_version"])}.')
+            meta = json.loads(str(data['meta']))
+            return cls(
+                gene=meta['gene'],
+                features=data['features'].tolist(),
+                paths=meta['paths'],
+                parents=data['parents'],
+                divider_exons=data['divider_exons'],
+                transcripts=meta['transcripts'],
+                weights=data['weights'],
+                intercepts=data['intercepts'],
+                tissues=meta['tissues'],
+                tissue_weights=data['tissue_weights'],
+                tissue_intercepts=data['tissue_intercepts'],
+            )
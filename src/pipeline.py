@@ -1,251 +1,345 @@
+import os
 import pickle
 import json
+import logging
+from functools import partial
 
+import numpy as np
 import pandas as pd
-import seaborn as sns
-from matplotlib import pyplot as plt
 from sklearn.model_selection import train_test_split
 
+from src.helpers.checkpoints import Checkpoints, fingerprint
 from src.helpers.pipeline import map_motifs_to_exons, make_exons_sf_df
-from src.helpers.plots import plot_isoforms_tree, plot_gene_isoforms
-from src.lr import elastic_net
-from src.utils.common import predict, get_scores, add_freq_to_df, make_sure_dir_exists, aggregated_score
+from src.helpers.results import make_results_table, make_isoforms_table, make_stability_table, write_results
+from src.lr import elastic_net, elastic_net_groups
+from src.model import TreeModel
+from src.stability import stability_config, stability_selection
+from src.tree import iter_nodes
+from src.utils.common import coefs_matrix, get_batch_scores, inlogit, add_freq_to_df, make_sure_dir_exists, parallel_map
+from src.utils.profiler import make_profiler, timed_call
+
+
+logger = logging.getLogger(__name__)
+
+
+def fit_job(job, params):
+    solver, data = job
+    if solver == 'groups':
+        return elastic_net_groups(*data, **params)
+    return [elastic_net(data, **params)]
 
 
 class Pipeline:
-    def __init__(self, config, gene_data, rbp_df, isoforms_df, rbps):
+    def __init__(self, config, gene_data, rbp_df, isoforms_df, rbps, profiler=None):
         self.config = config
         self.gene_data = gene_data
         self.rbp_df = rbp_df
         self.isoforms_df = isoforms_df
         self.rbps = rbps
         self.tree = None
+        self.stability = None
         self.tissue_specific = self.config.get('tissue_specific', False) and 'Tissue' in self.rbp_df
         self.tissues = []
         if self.tissue_specific:
-            self.tissues = set(self.rbp_df['Tissue'])
+            self.tissues = sorted(set(self.rbp_df['Tissue']))
             self.rbp_df = add_freq_to_df(self.rbp_df)
 
+        cache_dir = self.config.get('cache_dir', os.path.join(self.config['output_dir'], 'cache'))
+        self.checkpoints = Checkpoints(cache_dir if self.config.get('cache', True) else None)
+
         if 'Dataset.Type' in self.rbp_df.columns:
             self.train_index = self.rbp_df[self.rbp_df['Dataset.Type'] == 'Training'].index
             self.val_index = self.rbp_df[self.rbp_df['Dataset.Type'] == 'Validation'].index
         else:
             stratify = self.rbp_df['Tissue'] if self.tissue_specific else None
-            self.train_index, self.val_index = train_test_split(self.rbp_df.index, test_size=.25, stratify=stratify)
+            random_state = self.config.get('random_state')
+            # The split is part of the fit keys, a split drawn without a seed is saved and reused by later runs
+            self.train_index, self.val_index = self.checkpoints.cached(
+                'split', fingerprint(self.rbp_df.index, stratify, random_state),
+                lambda: train_test_split(self.rbp_df.index, test_size=.25, stratify=stratify, random_state=random_state),
+            )
+
+        # Row positions (in rbp_df and node feature matrices) of each split and each tissue within the split
+        self.split_rows = {
+            'train': self.rbp_df.index.get_indexer(self.train_index),
+            'validation': self.rbp_df.index.get_indexer(self.val_index),
+        }
+        self.tissue_rows = {split: {} for split in self.split_rows}
+        if self.tissue_specific:
+            sample_tissues = self.rbp_df['Tissue'].to_numpy()
+            for split, rows in self.split_rows.items():
+                for tissue in self.tissues:
+                    self.tissue_rows[split][tissue] = rows[sample_tissues[rows] == tissue]
+
+        self.profiler = profiler or make_profiler(self.config)
 
     def run(self):
-        exons_motifs = map_motifs_to_exons(self.gene_data, self.rbps)
-        tree = make_exons_sf_df(
-            self.gene_data,
-            self.rbp_df, self.isoforms_df,
-            gene_exon_motifs=exons_motifs,
+        gene = self.gene_data['gene_name']
+        # Stages are cached by the hash of their inputs, so a re-run only recomputes what has changed
+        logger.info('%s: mapping motifs to exons', gene)
+        with self.profiler.stage('motifs'):
+            exons_motifs = self.checkpoints.cached(
+                'motifs',
+                fingerprint(self.gene_data['sequence'], self.gene_data['exons'], self.gene_data['variable_exons'], self.rbps),
+                lambda: map_motifs_to_exons(self.gene_data, self.rbps, motif_index_dir=self.config.get('motif_index_dir')),
+            )
+        with self.profiler.stage('features'):
+            tree = make_exons_sf_df(
+                self.gene_data,
+                self.rbp_df, self.isoforms_df,
+                gene_exon_motifs=exons_motifs,
+                motif_rbps_only=self.config.get('motif_rbps_only', False),
+                tr_low=self.config.get('motif_tr_low', 1.0),
+                tr_high=self.config.get('motif_tr_high', 0.0),
+            )
+
+        with self.profiler.stage('fit'):
+            fit_key = self.fit(tree)
+        if stability_config(self.config)['replicates'] > 0:
+            with self.profiler.stage('stability'):
+                self.stability = self.checkpoints.cached(
+                    'stability', fingerprint(fit_key, stability_config(self.config)),
+                    lambda: self.stability_selection(tree),
+                )
+        self.tree = tree
+        evaluation_key = fingerprint(fit_key, self.split_rows, self.tissue_rows)
+        for stage, evaluate, prefix in [('predict', self.predict, 'predictions'), ('scores', self.accuracy, 'accuracy')]:
+            logger.info('%s: %s', gene, stage)
+            with self.profiler.stage(stage):
+                if not self.restore_nodes(stage, evaluation_key):
+                    evaluate()
+                    self.store_nodes(stage, evaluation_key, prefix)
+
+        self.report()
+
+    def report(self):
+        output_dir = self.config['output_dir']
+        with self.profiler.stage('save'):
+            TreeModel.from_tree(self.gene_data['gene_name'], self.tree, self.tissues).save(f'{output_dir}/model.npz')
+            self.save_results()
+            if self.config.get('save_tree_dirs', False):
+                self.save_res()
+        self.profiler.save(f'{output_dir}/profile.json', gene=self.gene_data['gene_name'])
+        # Plots are rendered from the saved results, 'deferred' plots are rendered by the caller (see build.py)
+        if self.config.get('plots', 'deferred') == 'inline':
+            from src.plot import render
+            render(output_dir)
+
+    @staticmethod
+    def fitted_nodes(tree):
+        # Right children models are complements of the left ones
+        return [node for node in iter_nodes(tree) if node is node.parent.left_child]
+
+    def stability_selection(self, tree):
+        nodes = [node for node in self.fitted_nodes(tree) if len(node.features)]
+        if not nodes:
+            return None
+        return stability_selection(nodes[0].matrix, nodes, self.config, self.profiler)
+
+    def fit(self, tree):
+        nodes = self.fitted_nodes(tree)
+        matrix_key = fingerprint(nodes[0].matrix.values, nodes[0].matrix.columns, nodes[0].matrix.index, nodes[0].matrix.meta) if nodes else None
+        params = self.config.get('elastic_net', {})
+
+        tasks = []
+        for node in nodes:
+            # Node data frame columns are node features, fraq and muted columns
+            if len(node.features) + 1 + len(node.matrix.meta.columns) > 2:
+                tasks.append((node, None, self.split_rows['train']))
+                for tissue in self.tissues:
+                    tasks.append((node, tissue, self.tissue_rows['train'][tissue]))
+        keys = [fingerprint(matrix_key, node.features, node.fraq, rows, tissue, params) for node, tissue, rows in tasks]
+
+        results = [self.checkpoints.load('fit', key) for key in keys]
+        missing = [i for i, res in enumerate(results) if res is None]
+        logger.info('%s: fitting %d models (%d cached)', self.gene_data['gene_name'], len(missing), len(tasks) - len(missing))
+        jobs = self.fit_jobs(tasks, missing)
+        fitted = parallel_map(
+            partial(timed_call, partial(fit_job, params=params)),
+            [job for _, job in jobs],
+            n_jobs=self.config.get('n_jobs', 1),
+            executor=self.config.get('executor', 'thread'),
         )
+        for (indices, (solver, _)), (job_results, elapsed, rss) in zip(jobs, fitted):
+            node, tissue, _ = tasks[indices[0]]
+            samples = sum(len(tasks[i][2]) for i in indices)
+            if solver == 'groups':
+                self.profiler.add('fit.elastic_net_groups', elapsed, rss, node=node.path, tissues=len(indices), samples=samples, features=len(node.features))
+            else:
+                self.profiler.add('fit.elastic_net', elapsed, rss, node=node.path, tissue=tissue or '', samples=samples, features=len(node.features))
+            for i, res in zip(indices, job_results):
+                self.checkpoints.save('fit', keys[i], res)
+                results[i] = res
+
+        for (node, tissue, _), res in zip(tasks, results):
+            if tissue is None:
+                node.res = res
+            else:
+                node.tissue_res[tissue] = res
+
+        return fingerprint(keys)
+
+    def fit_jobs(self, tasks, indices):
+        """Fit jobs of the tasks: every model on all tissues is a job, tissue models of a node are a single job if `grouped_fit`"""
+        jobs = []
+        groups = {}
+        for i in indices:
+            node, tissue, rows = tasks[i]
+            if tissue is None or not self.config.get('grouped_fit', True):
+                jobs.append(([i], ('single', self.task_frame(node, tissue, rows))))
+            else:
+                groups.setdefault(id(node), []).append(i)
+
+        for group in groups.values():
+            node = tasks[group[0]][0]
+            rows = [tasks[i][2] for i in group]
+            offsets = np.cumsum([0] + [len(r) for r in rows])
+            all_rows = np.concatenate(rows)
+            data = (
+                node.matrix.values[np.ix_(all_rows, node.features)], node.fraq[all_rows],
+                [np.arange(start, end) for start, end in zip(offsets[:-1], offsets[1:])],
+                node.matrix.columns[node.features],
+            )
+            jobs.append((group, ('groups', data)))
 
-        nodes = [tree.left_child, tree.right_child]
-        while len(nodes):
-            for node in nodes[::2]:
-                df = node.df.loc[self.train_index]
-                if len(df.columns) > 2:
-                    res = elastic_net(df)
-                    node.res = res
-                    if self.tissue_specific:
-                        node.tissue_res = {}
-                        for tissue in self.tissues:
-                            print(tissue)
-                            tissue_df = df[df['Tissue'] == tissue]
-                            tissue_df['Freq'] = 1
-                            res = elastic_net(tissue_df)
-                            node.tissue_res[tissue] = res
-            cur_nodes = []
-            for node in nodes:
-                if node.left_child is not None:
-                    cur_nodes += [node.left_child, node.right_child]
-            nodes = cur_nodes
-
-        with open(f'{self.config["output_dir"]}/pipeline.wb', 'wb') as res_file:
-            pickle.dump(self, res_file)
-
-        plot_gene_isoforms(self.gene_data, output_dir=self.config['output_dir'])
+        return jobs
 
-        self.tree = tree
-        self.predict()
-        self.accuracy()
-        self.plot()
-        self.save_res()
-        plot_isoforms_tree(tree, output_dir=self.config['output_dir'])
+    @staticmethod
+    def task_frame(node, tissue, rows):
+        df = node.frame(rows)
+        return df if tissue is None else df.assign(Freq=1)
+
+    def store_nodes(self, stage, key, prefix):
+        self.checkpoints.save(stage, key, [
+            (
+                {k: v for k, v in node.res.items() if k.startswith(prefix)},
+                {tissue: {k: v for k, v in res.items() if k.startswith(prefix)} for tissue, res in node.tissue_res.items()},
+            )
+            for node in iter_nodes(self.tree)
+        ])
+
+    def restore_nodes(self, stage, key):
+        state = self.checkpoints.load(stage, key)
+        if state is None:
+            return False
+
+        for node, (res, tissue_res) in zip(iter_nodes(self.tree), state):
+            node.res.update(res)
+            for tissue, values in tissue_res.items():
+                node.tissue_res.setdefault(tissue, {}).update(values)
+
+        return True
 
     @staticmethod
     def load_from_file(path_to_file):
-        with open(path_to_file) as class_file:
+        with open(path_to_file, 'rb') as class_file:
             return pickle.load(class_file)
 
+    def node_fraq(self, node, rows):
+        return pd.Series(node.fraq[rows], index=self.rbp_df.index[rows])
+
+    @staticmethod
+    def predict_tree(nodes, coefs_list, rows):
+        # Probabilities of all nodes (left and right siblings in turn) and their products along root-to-node paths
+        matrix = nodes[0].matrix
+        weights, intercepts = coefs_matrix(coefs_list, matrix.columns)
+        used = np.flatnonzero((weights != 0).any(axis=1))
+        left = inlogit(np.dot(matrix.values[np.ix_(rows, used)], weights[used]) + intercepts)
+
+        predictions = np.empty((len(rows), len(nodes)))
+        predictions[:, 0::2], predictions[:, 1::2] = left, 1 - left
+        accumulative = np.empty_like(predictions)
+        node_ids = {id(node): j for j, node in enumerate(nodes)}
+        for j, node in enumerate(nodes):
+            parent_id = node_ids.get(id(node.parent))
+            accumulative[:, j] = predictions[:, j] if parent_id is None else accumulative[:, parent_id] * predictions[:, j]
+
+        return predictions, accumulative
+
     def predict(self):
         if self.tree is None:
             return
 
-        nodes = [self.tree.left_child, self.tree.right_child]
-        while len(nodes):
-            cur_nodes = []
-            for node_id, node in enumerate(nodes):
-                if node_id % 2 == 0:
-                    node.res['predictions.train'] = predict(node.df.loc[self.train_index], node.res['coefs'], logit=False)
-                    node.res['predictions.validation'] = predict(node.df.loc[self.val_index], node.res['coefs'], logit=False)
-
-                    for tissue in self.tissues:
-                        node.tissue_res[tissue]['predictions.train'] = predict(
-                            node.df.loc[self.train_index].query(f'Tissue == "{tissue}"'),
-                            node.tissue_res[tissue]['coefs'],
-                            logit=False,
-                        )
-                        node.tissue_res[tissue]['predictions.validation'] = predict(
-                            node.df.loc[self.val_index].query(f'Tissue == "{tissue}"'),
-                            node.tissue_res[tissue]['coefs'],
-                            logit=False,
-                        )
-                else:
-                    node.res['predictions.train'] = 1 - nodes[node_id - 1].res['predictions.train']
-                    node.res['predictions.validation'] = 1 - nodes[node_id - 1].res['predictions.validation']
-
-                    for tissue in self.tissues:
-                        node.tissue_res[tissue] = {
-                            'predictions.train': 1 - nodes[node_id - 1].tissue_res[tissue]['predictions.train'],
-                            'predictions.validation': 1 - nodes[node_id - 1].tissue_res[tissue]['predictions.validation'],
-                        }
-
-                node.res['predictions.train.accumulative'] = node.parent.res.get('predictions.train.accumulative', 1) * node.res['predictions.train']
-                node.res['predictions.validation.accumulative'] = node.parent.res.get('predictions.validation.accumulative', 1) * node.res['predictions.validation']
-
-                for tissue in self.tissues:
-                    node.tissue_res[tissue]['predictions.train.accumulative'] = node.parent.tissue_res.get(tissue, {}).get('predictions.train.accumulative', 1) * node.tissue_res[tissue]['predictions.train']
-                    node.tissue_res[tissue]['predictions.validation.accumulative'] = node.parent.tissue_res.get(tissue, {}).get('predictions.validation.accumulative', 1) * node.tissue_res[tissue]['predictions.validation']
-
-                if node.left_child is not None:
-                    cur_nodes += [node.left_child, node.right_child]
+        nodes = list(iter_nodes(self.tree))
+        for split, rows in self.split_rows.items():
+            predictions, accumulative = self.predict_tree(nodes, [node.res.get('coefs') for node in nodes[::2]], rows)
+            for j, node in enumerate(nodes):
+                node.res[f'predictions.{split}'] = pd.Series(predictions[:, j], index=self.rbp_df.index[rows])
+                node.res[f'predictions.{split}.accumulative'] = pd.Series(accumulative[:, j], index=self.rbp_df.index[rows])
+
+            for tissue in self.tissues:
+                rows = self.tissue_rows[split][tissue]
+                predictions, accumulative = self.predict_tree(
+                    nodes, [node.tissue_res.get(tissue, {}).get('coefs') for node in nodes[::2]], rows,
+                )
+                for j, node in enumerate(nodes):
+                    tissue_res = node.tissue_res.setdefault(tissue, {})
+                    tissue_res[f'predictions.{split}'] = pd.Series(predictions[:, j], index=self.rbp_df.index[rows])
+                    tissue_res[f'predictions.{split}.accumulative'] = pd.Series(accumulative[:, j], index=self.rbp_df.index[rows])
 
-            nodes = cur_nodes
+    @staticmethod
+    def batch_accuracy(nodes, results, fraq, rows):
+        leaves = [j for j, node in enumerate(nodes) if node.left_child is None]
+        accuracy = [{} for _ in nodes]
+        for split in ['train', 'validation']:
+            predictions = np.stack([res[f'predictions.{split}'].to_numpy() for res in results], axis=1)
+            for j, scores in enumerate(get_batch_scores(predictions, fraq[rows[split]])):
+                accuracy[j][split] = scores
+        # Leaf nodes (isoforms) are also evaluated by the products along the root-to-leaf paths
+        for split in ['train', 'validation']:
+            predictions = np.stack([results[j][f'predictions.{split}.accumulative'].to_numpy() for j in leaves], axis=1)
+            for j, scores in zip(leaves, get_batch_scores(predictions, fraq[rows[split]][:, leaves])):
+                accuracy[j][f'{split}.accumulative'] = scores
+
+        return accuracy
 
     def accuracy(self):
         if self.tree is None:
             return
 
-        nodes = [self.tree.left_child, self.tree.right_child]
-        while len(nodes):
-            cur_nodes = []
-            for node_id, node in enumerate(nodes):
-                print(node.res['predictions.train'], node.df.loc[self.train_index]['fraq'])
-                train_acc = get_scores(node.res['predictions.train'], node.df.loc[self.train_index]['fraq'])
-                val_acc = get_scores(node.res['predictions.validation'], node.df.loc[self.val_index]['fraq'])
-                node.res['accuracy'] = {
-                    'train': train_acc,
-                    'validation': val_acc,
-                }
-                for tissue in self.tissues:
-                    train_acc = get_scores(node.tissue_res[tissue]['predictions.train'], node.df.loc[self.train_index].query(f'Tissue == "{tissue}"')['fraq'])
-                    val_acc = get_scores(node.tissue_res[tissue]['predictions.validation'], node.df.loc[self.val_index].query(f'Tissue == "{tissue}"')['fraq'])
-                    node.tissue_res[tissue]['accuracy'] = {
-                        'train': train_acc,
-                        'validation': val_acc,
-                    }
-                if node.left_child is not None:
-                    cur_nodes += [node.left_child, node.right_child]
-                else: # leaf node (isoform)
-                    node.res['accuracy']['train.accumulative'] = get_scores(
-                        node.res['predictions.train.accumulative'],
-                        node.df.loc[self.train_index]['fraq'],
-                    )
-                    node.res['accuracy']['validation.accumulative'] = get_scores(
-                        node.res['predictions.validation.accumulative'],
-                        node.df.loc[self.val_index]['fraq'],
-                    )
-
-                    for tissue in self.tissues:
-                        node.tissue_res[tissue]['accuracy']['train.accumulative'] = get_scores(
-                            node.tissue_res[tissue]['predictions.train.accumulative'],
-                            node.df.loc[self.train_index].query(f'Tissue == "{tissue}"')['fraq'],
-                        )
-                        node.tissue_res[tissue]['accuracy']['validation.accumulative'] = get_scores(
-                            node.tissue_res[tissue]['predictions.validation.accumulative'],
-                            node.df.loc[self.val_index].query(f'Tissue == "{tissue}"')['fraq'],
-                        )
-
-            nodes = cur_nodes
-
-    def plot(self):
+        nodes = list(iter_nodes(self.tree))
+        fraq = np.stack([node.fraq for node in nodes], axis=1)
+        accuracy = self.batch_accuracy(nodes, [node.res for node in nodes], fraq, self.split_rows)
+        for node, node_accuracy in zip(nodes, accuracy):
+            node.res['accuracy'] = node_accuracy
+
+        for tissue in self.tissues:
+            results = [node.tissue_res[tissue] for node in nodes]
+            accuracy = self.batch_accuracy(nodes, results, fraq, {split: self.tissue_rows[split][tissue] for split in self.split_rows})
+            for res, node_accuracy in zip(results, accuracy):
+                res['accuracy'] = node_accuracy
+
+    def save_results(self):
         if self.tree is None:
             return
 
-        nodes = [self.tree.left_child, self.tree.right_child]
-        transcript_accuracies = {}
-        while len(nodes):
-            cur_nodes = []
-            for node_id, node in enumerate(nodes):
-                if node.left_child is not None:
-                    cur_nodes += [node.left_child, node.right_child]
-                else:
-                    transcript = node.kwargs[0]['transcript_id']
-                    transcript_accuracies[transcript] = {
-                        'var.train': self.isoforms_df.loc[self.train_index][transcript],
-                        'var.validation': self.isoforms_df.loc[self.val_index][transcript],
-                        'train': node.res['accuracy']['train.accumulative'],
-                        'validation': node.res['accuracy']['validation.accumulative'],
-                        'tissue': {
-                            tissue: {
-                                'train': node.tissue_res[tissue]['accuracy']['train.accumulative'],
-                                'validation': node.tissue_res[tissue]['accuracy']['validation.accumulative'],
-                                'var.train': self.isoforms_df.loc[set(self.train_index)&set(self.rbp_df[self.rbp_df['Tissue'] == tissue].index)][transcript],
-                                'var.validation': self.isoforms_df.loc[set(self.val_index)&set(self.rbp_df[self.rbp_df['Tissue'] == tissue].index)][transcript],
-                            } for tissue in node.tissue_res
-                        }
-                    }
-            nodes = cur_nodes
-
-        make_sure_dir_exists(f"{self.config['output_dir']}/scores/")
-        for score in ['cor', 'mds']:
-            plt.figure(figsize=(8, 6))
-            bx = sns.boxplot(
-                data=self.isoforms_df[list(transcript_accuracies.keys())].div(self.isoforms_df[list(transcript_accuracies.keys())].sum(axis=1), axis=0),
-            )
-            ax2 = bx.twinx()
-            sns.scatterplot(
-                x=transcript_accuracies.keys(),
-                y=[transcript_accuracies[iso]['validation'][score] for iso in transcript_accuracies],
-                color='blue', s=200, ax=ax2,
-            )
-            sns.scatterplot(
-                x=transcript_accuracies.keys(),
-                y=[transcript_accuracies[iso]['train'][score] for iso in transcript_accuracies],
-                color='red', s=200, ax=ax2,
-            )
-            ax2.legend(['Validation', 'Training'])
-            bx.set_xticklabels(bx.get_xticklabels(), rotation=90)
-            ax2.set_xticklabels(bx.get_xticklabels(), rotation=90)
-            ax2.set_ylim(0, 1)
-            bx.set_ylim(0, 1)
-            plt.grid(visible=True)
-            plt.tight_layout()
-            plt.show()
-            plt.savefig(f"{self.config['output_dir']}/scores/{score}.png", dpi=300)
-
-            if self.tissue_specific:
-                tissue_scores = [aggregated_score(transcript_accuracies, tissue) for tissue in self.tissues]
-                plt.figure(figsize=(8, 6))
-                ax = sns.scatterplot(
-                    x=list(self.tissues),
-                    y=[s['validation'][score] for s in tissue_scores],
-                    color='blue', s=200,
-                )
-                sns.scatterplot(
-                    x=list(self.tissues),
-                    y=[s['train'][score] for s in tissue_scores],
-                    color='red', s=200, ax=ax,
-                )
-                ax.legend(['Validation', 'Training'])
-                plt.xticks(rotation=90)
-                ax.set_ylim(0, 1)
-                plt.grid(visible=True)
-                plt.tight_layout()
-                plt.show()
-                plt.savefig(f"{self.config['output_dir']}/scores/by_tissue.{score}.png", dpi=300)
+        gene = self.gene_data['gene_name']
+        write_results(
+            f"{self.config['output_dir']}/results.parquet",
+            pd.concat([
+                make_results_table(gene, self.tree),
+                make_isoforms_table(gene, self.tree, self.isoforms_df, self.rbp_df.index, self.split_rows, self.tissue_rows),
+                make_stability_table(gene, self.stability) if self.stability is not None else None,
+            ], ignore_index=True),
+            metadata={
+                'version': 1,
+                'gene': gene,
+                'config': self.config,
+                # Feature matrices are not saved, only references to the input data and samples used
+                'data': {key: self.config.get(key) for key in ['rbp_data_path', 'isoforms_data_path', 'rbps_path', 'pwms_path']},
+                'samples': {split: [str(i) for i in self.rbp_df.index[rows]] for split, rows in self.split_rows.items()},
+                'tissues': sorted(self.tissues),
+                'stability': {**stability_config(self.config), 'seed': self.stability['seed']} if self.stability is not None else None,
+                'gene_structure': {
+                    'gene_name': gene,
+                    'exon_numbers': self.gene_data['exon_numbers'],
+                    'variable_exon_numbers': self.gene_data['variable_exon_numbers'],
+                    'transcripts': [
+                        {'transcript_id': t['transcript_id'], 'exon_numbers': t['exon_numbers']} for t in self.gene_data['transcripts']
+                    ],
+                },
+            },
+        )
 
     @staticmethod
     def save_res_(node, path):
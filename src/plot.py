@@ -0,0 +1,42 @@
+import os
+import sys
+import logging
+
+from src.helpers.results import read_results
+from src.utils.profiler import Profiler
+
+
+logger = logging.getLogger(__name__)
+
+
+def render(output_dir):
+    """Render all plots of a single gene run from its results.parquet"""
+    # Plotting libraries are imported only by the processes rendering plots
+    from src.helpers.plots import plot_results
+
+    # Rendering time is added to the profile of the run
+    profile_path = os.path.join(output_dir, 'profile.json')
+    profiler = Profiler.load(profile_path) if os.path.exists(profile_path) else Profiler(enabled=False)
+    with profiler.stage('plots'):
+        results, metadata = read_results(os.path.join(output_dir, 'results.parquet'))
+        plot_results(results, metadata, output_dir)
+    profiler.save(profile_path)
+
+    return output_dir
+
+
+def main(output_dirs):
+    for output_dir in output_dirs:
+        try:
+            render(output_dir)
+            logger.info('Plotted %s', output_dir)
+        except Exception:
+            logger.exception('%s failed', output_dir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Please specify results directories', file=sys.stderr)
+        sys.exit(1)
+
+    main(sys.argv[1:])
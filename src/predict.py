@@ -0,0 +1,59 @@
+import os
+import sys
+import logging
+
+import pandas as pd
+
+from src.model import TreeModel
+from src.utils.common import make_sure_dir_exists
+from src.utils.matrix_cache import is_matrix_cache, load_matrix_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+def iter_samples(input_path, columns, chunk_size=10000):
+    """Read only the requested columns of samples x features table (parquet, tsv or binary cache) by chunks"""
+    columns = set(columns)
+    if is_matrix_cache(input_path):
+        df = load_matrix_cache(input_path, columns=columns)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+    elif input_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(input_path)
+        index_columns = [c for c in (parquet_file.schema_arrow.pandas_metadata or {}).get('index_columns', []) if isinstance(c, str)]
+        names = [c for c in parquet_file.schema_arrow.names if c in columns or c in index_columns]
+        # Index columns are restored from the pandas metadata
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=names):
+            yield batch.to_pandas()
+    else:
+        header = pd.read_csv(input_path, sep='\t', nrows=0).columns
+        usecols = [0] + [i for i, c in enumerate(header) if i > 0 and c in columns]
+        yield from pd.read_csv(input_path, sep='\t', index_col=0, usecols=usecols, chunksize=chunk_size)
+
+
+def main(model_paths, input_path, output_dir, chunk_size=10000, by_tissue=False):
+    models = [TreeModel.load(model_path) for model_path in model_paths]
+    make_sure_dir_exists(output_dir)
+    output_paths = [os.path.join(output_dir, f'{model.gene}_predictions.tsv') for model in models]
+
+    columns = set(c for model in models for c in model.features) | {'Tissue', 'Cancer'}
+    n_samples = 0
+    for i, df in enumerate(iter_samples(input_path, columns, chunk_size=chunk_size)):
+        df = df.rename(columns={'Cancer': 'Tissue'})
+        for model, output_path in zip(models, output_paths):
+            model.predict(df, by_tissue=by_tissue).to_csv(output_path, sep='\t', mode='w' if i == 0 else 'a', header=i == 0)
+        n_samples += len(df)
+        logger.info('Scored %d samples...', n_samples)
+
+    return output_paths
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print('Please specify model, input and output paths', file=sys.stderr)
+        sys.exit(1)
+
+    main([sys.argv[1]], sys.argv[2], sys.argv[3])
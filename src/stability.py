@@ -0,0 +1,187 @@
+"""Stability of the node models over bootstrap samples or repeated train/validation splits
+
+Every replicate refits the models of all tree nodes on its own samples. Replicates run in a process pool,
+the feature matrix and node fractions are put to shared memory once and every worker maps them instead
+of receiving a copy. Replicate seeds are spawned from a single seed, so results do not depend on the
+number of workers.
+"""
+import os
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.lr import elastic_net_gram
+from src.utils.common import get_batch_scores, inlogit
+from src.utils.profiler import timed_call
+
+
+logger = logging.getLogger(__name__)
+
+methods = ['bootstrap', 'splits']
+
+# Data of the replicates in the current process (see `init_worker`)
+shared = {}
+
+
+def draw_replicate(n_samples, seed, method='bootstrap', test_size=.25):
+    """Training rows (in random order), their weights and held-out rows of a replicate"""
+    rng = np.random.default_rng(seed)
+    if method == 'bootstrap':
+        # Repeated samples are weighted by their counts, out-of-bag samples are held out
+        counts = np.bincount(rng.integers(n_samples, size=n_samples), minlength=n_samples)
+        rows = rng.permutation(np.flatnonzero(counts))
+        return rows, counts[rows].astype(np.float64), np.flatnonzero(counts == 0)
+    if method == 'splits':
+        rows = rng.permutation(n_samples)
+        n_test = int(np.ceil(test_size * n_samples))
+        return rows[n_test:], np.ones(n_samples - n_test), rows[:n_test]
+    raise ValueError(f'Unknown stability method {method}')
+
+
+def share_arrays(arrays):
+    """Copy arrays to shared memory, returns the memory blocks and their specs for `init_worker`"""
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+def init_worker(specs, data):
+    blocks = []
+    for name, (block_name, shape, dtype) in specs.items():
+        # Blocks are unlinked by the parent process
+        block = shared_memory.SharedMemory(name=block_name)
+        shared[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        blocks.append(block)
+    shared.update(data, blocks=blocks)
+
+
+def fit_replicate(seed):
+    """Coefficients of all node models fitted on the replicate samples and their held-out scores"""
+    values, fraqs, weights = shared['values'], shared['fraqs'], shared['weights']
+    rows, counts, held_out = draw_replicate(len(values), seed, **shared['design'])
+    coefs, predictions = [], np.empty((len(held_out), len(fraqs)))
+    for j, (features, fraq) in enumerate(zip(shared['features'], fraqs)):
+        # Columns of the coefficients table are positions in the node features
+        res = elastic_net_gram(
+            values[np.ix_(rows, features)], fraq[rows], np.arange(len(features)),
+            sample_weight=counts * weights[rows], **shared['params'],
+        )
+        estimates = res['coefs']['Estimate']
+        intercept = estimates['(Intercept)']
+        estimates = estimates.drop('(Intercept)')
+        positions = estimates.index.to_numpy(dtype=np.int64)
+        # Fractions as `Pipeline.predict_tree` predicts them, so the scores are comparable with the pipeline scores
+        predictions[:, j] = inlogit(np.dot(values[np.ix_(held_out, features[positions])], estimates.to_numpy()) + intercept)
+        coefs.append((positions, estimates.to_numpy()))
+
+    return coefs, get_batch_scores(predictions, fraqs[:, held_out].T)
+
+
+def timed_replicate(seed):
+    return timed_call(fit_replicate, seed)
+
+
+def stability_config(config):
+    stability = {
+        'replicates': 0,
+        'method': 'bootstrap',
+        'test_size': .25,
+        'ci': .95,
+        'seed': config.get('random_state'),
+        # Same parallelism as the fitting of a gene, so batch mode workers do not oversubscribe the cores
+        'processes': config.get('n_jobs', 1),
+        **config.get('stability', {}),
+    }
+    if stability['processes'] in (None, -1):
+        stability['processes'] = os.cpu_count()
+    if stability['method'] not in methods:
+        raise ValueError(f"Unknown stability method {stability['method']}, expected one of {methods}")
+    return stability
+
+
+def run_replicates(seeds, arrays, data, processes=1):
+    # Daemonic processes (e.g. batch mode workers) are not allowed to have children, replicates run in threads
+    if processes <= 1 or len(seeds) < 2 or mp.current_process().daemon:
+        shared.update(arrays, **data)
+        try:
+            if processes <= 1:
+                return list(map(timed_replicate, seeds))
+            with ThreadPoolExecutor(max_workers=processes) as pool:
+                return list(pool.map(timed_replicate, seeds))
+        finally:
+            shared.clear()
+
+    blocks, specs = share_arrays(arrays)
+    try:
+        with ProcessPoolExecutor(
+            min(processes, len(seeds)), mp_context=mp.get_context('spawn'), initializer=init_worker, initargs=(specs, data),
+        ) as pool:
+            return list(pool.map(timed_replicate, seeds, chunksize=max(1, len(seeds) // (4 * processes))))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def stability_selection(matrix, nodes, config, profiler=None):
+    """Selection frequency and confidence intervals of the node model coefficients and distributions of the held-out scores
+
+    Returns the tables of coefficients of every node and feature selected in at least one replicate and of scores
+    of every node and replicate, and the seed of the replicates (drawn if not set, so the run can be repeated).
+    """
+    stability = stability_config(config)
+    n_replicates = stability['replicates']
+    seed_sequence = np.random.SeedSequence(stability['seed'])
+    seeds = seed_sequence.spawn(n_replicates)
+    weights = matrix.meta['Freq'].to_numpy(dtype=np.float64) if 'Freq' in matrix.meta.columns else np.ones(len(matrix.index))
+    arrays = {
+        'values': matrix.values,
+        'fraqs': np.stack([node.fraq for node in nodes]).astype(np.float64),
+        'weights': weights,
+    }
+    data = {
+        'features': [np.asarray(node.features) for node in nodes],
+        'design': {'method': stability['method'], 'test_size': stability['test_size']},
+        'params': config.get('elastic_net', {}),
+    }
+    logger.info('Fitting %d nodes on %d %s replicates', len(nodes), n_replicates, stability['method'])
+    replicates = run_replicates(seeds, arrays, data, processes=stability['processes'])
+
+    coefficients, scores = [], []
+    level = (1 - stability['ci']) / 2
+    for j, node in enumerate(nodes):
+        estimates = np.zeros((n_replicates, len(node.features)))
+        for r, ((coefs, node_scores), _, _) in enumerate(replicates):
+            positions, values = coefs[j]
+            estimates[r, positions] = values
+            scores.append({'node': node.path, 'replicate': r, **node_scores[j]})
+
+        selected = np.flatnonzero((estimates != 0).any(axis=0))
+        low, median, high = np.quantile(estimates[:, selected], [level, .5, 1 - level], axis=0)
+        coefficients.append(pd.DataFrame({
+            'node': node.path,
+            'name': matrix.columns[np.asarray(node.features)[selected]],
+            'frequency': (estimates[:, selected] != 0).mean(axis=0),
+            'mean': estimates[:, selected].mean(axis=0),
+            'median': median,
+            'ci_low': low,
+            'ci_high': high,
+        }))
+
+    if profiler is not None:
+        for r, (_, elapsed, rss) in enumerate(replicates):
+            profiler.add('stability.replicate', elapsed, rss, replicate=r)
+
+    return {
+        'coefficients': pd.concat(coefficients, ignore_index=True).sort_values(['node', 'frequency'], ascending=[True, False], ignore_index=True),
+        'scores': pd.DataFrame(scores),
+        'seed': seed_sequence.entropy,
+    }
@@ -1,4 +1,9 @@
 class TranscriptsTreeNode:
+    __slots__ = (
+        'kwargs', 'parent', 'divider_exon', 'left_child', 'right_child', 'node_id',
+        'matrix', 'features', 'fraq', 'res', 'tissue_res',
+    )
+
     def __init__(self, kwargs, parent=None, divider_exon=-1):
         self.kwargs = kwargs
         self.parent = parent
@@ -6,10 +11,42 @@ class TranscriptsTreeNode:
         self.left_child = None
         self.right_child = None
         self.node_id = None
-        self.df = None
+        # Node data is a view of the shared FeatureMatrix: column positions of the node RBPs and isoforms ratio
+        self.matrix = None
+        self.features = None
+        self.fraq = None
         self.res = {}
         self.tissue_res = {}
 
+    @property
+    def path(self):
+        # Same as the node directory in `Pipeline.save_res`, e.g. 'left/right'
+        if self.parent is None:
+            return ''
+        side = 'left' if self is self.parent.left_child else 'right'
+        return f'{self.parent.path}/{side}' if self.parent.parent is not None else side
+
+    @property
+    def df(self):
+        return self.frame()
+
+    def frame(self, rows=None):
+        if self.matrix is None:
+            return None
+
+        return self.matrix.frame(self.features, self.fraq, rows=rows)
+
     def set_children(self, left=None, right=None):
         self.left_child = left
         self.right_child = right
+
+
+def iter_nodes(tree):
+    nodes = [tree.left_child, tree.right_child] if tree.left_child is not None else []
+    while len(nodes):
+        cur_nodes = []
+        for node in nodes:
+            yield node
+            if node.left_child is not None:
+                cur_nodes += [node.left_child, node.right_child]
+        nodes = cur_nodes
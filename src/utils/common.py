@@ -1,7 +1,11 @@
 import os
 import re
+import logging
+import warnings
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from functools import partial
-import matplotlib.pyplot as plt
+
 import numpy as np
 import pandas as pd
 from scipy.stats import pearsonr, mannwhitneyu
@@ -11,6 +15,8 @@ from src.consts import muted_columns
 
 
 def save_plt_fig(name, format):
+    import matplotlib.pyplot as plt
+
     if format == 'tiff':
         kwargs = {'compression': 'tiff_lzw'} if format == 'tiff' else None
         plt.savefig(name, format=format, pil_kwargs=kwargs, dpi=350)
@@ -18,6 +24,14 @@ def save_plt_fig(name, format):
         plt.savefig(name, format=format, dpi=350)
 
 
+def setup_logging(level='INFO'):
+    """Log messages of all modules to stderr, `level` is a logging level name (e.g. DEBUG)"""
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+
 def getattr_with_kwargs(module, method):
     if isinstance(method, dict):
         return partial(getattr(module, method['name']), **method.get('kwargs', {}))
@@ -26,7 +40,10 @@ def getattr_with_kwargs(module, method):
 
 
 def intersect_dfs(dfs):
-    common_index = set(dfs[0].index).intersection(*map(lambda df: df.index, dfs[1:]))
+    # Rows keep the order of the first frame, so the splits and cache keys do not depend on the hash seed
+    common_index = dfs[0].index
+    for df in dfs[1:]:
+        common_index = common_index.intersection(df.index, sort=False)
     return [df.loc[common_index] for df in dfs]
 
 
@@ -37,6 +54,20 @@ def make_sure_dir_exists(dir_path):
     return dir_path
 
 
+def parallel_map(func, items, n_jobs=1, executor='thread'):
+    n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+    if n_jobs <= 1 or len(items) < 2:
+        return list(map(func, items))
+
+    # Daemonic processes (e.g. batch mode workers) are not allowed to have children
+    if executor == 'process' and not mp.current_process().daemon:
+        pool_class = ProcessPoolExecutor
+    else:
+        pool_class = ThreadPoolExecutor
+    with pool_class(max_workers=min(n_jobs, len(items))) as pool:
+        return list(pool.map(func, items))
+
+
 def logit(x):
     return np.log(x / (1 - x))
 
@@ -45,6 +76,14 @@ def inlogit(y):
     return np.exp(y) / (1 + np.exp(y))
 
 
+def pearson_columns(x, y):
+    """Pearson correlation of every column of `x` with `y` (nan for constant columns)"""
+    x = x - x.mean(axis=0)
+    y = y - y.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (x * y).sum(axis=0) / np.sqrt((x**2).sum(axis=0) * (y**2).sum(axis=0))
+
+
 def find_substring_occurrences(substring, string):
     return [m.start() for m in re.finditer(substring, string)]
 
@@ -93,29 +132,103 @@ def get_scores(pred, true):
     }
 
 
+def coefs_matrix(coefs_list, columns):
+    """Stack coefficient tables into (n_features, n_models) weights and intercepts, missing models give nan"""
+    weights = np.zeros((len(columns), len(coefs_list)))
+    intercepts = np.zeros(len(coefs_list))
+    for j, coefs in enumerate(coefs_list):
+        if coefs is None:
+            intercepts[j] = np.nan
+            continue
+        estimates = coefs['Estimate'].drop('(Intercept)', errors='ignore')
+        positions = columns.get_indexer(estimates.index)
+        weights[positions[positions >= 0], j] = estimates.to_numpy()[positions >= 0]
+        intercepts[j] = coefs['Estimate'].get('(Intercept)', 0)
+
+    return weights, intercepts
+
+
+# Scores of an empty sample (see `get_scores`)
+empty_scores = {'cor': 0, 'r2': 0, 'mann-w': 0, 'uplift': 1, 'mds': 0, 'mean_pred': 0, 'mean_true': 0}
+
+
+def get_batch_scores(pred, true):
+    """`get_scores` for every column of (n_samples, n_models) predictions and true ratios at once"""
+    pred, true = np.array(pred, dtype=np.float64), np.array(true, dtype=np.float64)
+    if pred.shape[0] == 0:
+        # E.g. a tissue without samples in the split
+        return [dict(empty_scores) for _ in range(pred.shape[1])]
+    nans = np.isnan(pred) | np.isnan(true)
+    pred[nans], true[nans] = np.nan, np.nan
+    n = (~nans).sum(axis=0)
+    logit_true = logit(true)
+
+    # Columns without samples (all nan) give nan means and medians, their scores are `empty_scores`
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        pred_centered = pred - np.nanmean(pred, axis=0)
+        true_centered = logit_true - np.nanmean(logit_true, axis=0)
+        ss_pred = np.nansum(pred_centered**2, axis=0)
+        # Centered constant columns are rounding residues rather than zeros, pearsonr gives nan for them
+        constant_pred = np.fmax.reduce(pred, axis=0) == np.fmin.reduce(pred, axis=0)
+        constant_true = np.fmax.reduce(logit_true, axis=0) == np.fmin.reduce(logit_true, axis=0)
+        cor = np.nansum(pred_centered * true_centered, axis=0) / np.sqrt(ss_pred * np.nansum(true_centered**2, axis=0))
+        cor[(n < 2) | constant_pred | constant_true] = np.nan
+        # r2_score(pred, logit(true)) with its handling of constant `pred`
+        ss_res = np.nansum((pred - logit_true)**2, axis=0)
+        r2 = np.where(~constant_pred, 1 - ss_res / ss_pred, np.where(ss_res == 0, 1.0, 0.0))
+        r2 = np.maximum(0, r2)
+
+        # Small samples may use the exact test, which is chosen per column as in `get_scores`
+        mann_w = np.zeros(pred.shape[1])
+        large = n > 8
+        if large.any():
+            mann_w[large] = mannwhitneyu(
+                inlogit(pred[:, large]), true[:, large], axis=0,
+                nan_policy='omit' if nans[:, large].any() else 'propagate',
+            )[1]
+        for j in np.flatnonzero((n > 0) & ~large):
+            mann_w[j] = mannwhitneyu(inlogit(pred[~nans[:, j], j]), true[~nans[:, j], j])[1]
+
+        mean_pred, mean_true = np.nanmedian(inlogit(pred), axis=0), np.nanmedian(true, axis=0)
+        uplift = (mean_pred - mean_true) / mean_true
+        mds = np.maximum(0, 1 - np.abs(uplift))
+
+    return [
+        {
+            'cor': float(cor[j]),
+            'r2': float(r2[j]),
+            'mann-w': float(mann_w[j]),
+            'uplift': float(uplift[j]),
+            'mds': float(mds[j]),
+            'mean_pred': float(mean_pred[j]),
+            'mean_true': float(mean_true[j]),
+        } if n[j] else dict(empty_scores)
+        for j in range(pred.shape[1])
+    ]
+
+
 def aggregated_score(transcript_accuracies, tissue):
-    transcripts_variance_train = sum(transcript_accuracies[iso]['tissue'][tissue]['var.train'].dropna().var() for iso in transcript_accuracies)
-    transcripts_variance_val = sum(transcript_accuracies[iso]['tissue'][tissue]['var.validation'].dropna().var() for iso in transcript_accuracies)
+    transcripts_variance_train = sum(transcript_accuracies[iso]['tissue'][tissue]['var.train'] for iso in transcript_accuracies)
+    transcripts_variance_val = sum(transcript_accuracies[iso]['tissue'][tissue]['var.validation'] for iso in transcript_accuracies)
     return {
         'train': {
             'cor': sum(
-                transcript_accuracies[iso]['tissue'][tissue]['train']['cor'] * transcript_accuracies[iso]['tissue'][tissue]['var.train'].dropna().var()
+                transcript_accuracies[iso]['tissue'][tissue]['train']['cor'] * transcript_accuracies[iso]['tissue'][tissue]['var.train']
                 for iso in transcript_accuracies
             ) / transcripts_variance_train,
             'mds': sum(
-                transcript_accuracies[iso]['tissue'][tissue]['train']['mds'] * transcript_accuracies[iso]['tissue'][tissue]['var.train'].dropna().var()
+                transcript_accuracies[iso]['tissue'][tissue]['train']['mds'] * transcript_accuracies[iso]['tissue'][tissue]['var.train']
                 for iso in transcript_accuracies
             ) / transcripts_variance_train
         },
         'validation': {
             'cor': sum(
-                transcript_accuracies[iso]['tissue'][tissue]['validation']['cor'] * transcript_accuracies[iso]['tissue'][tissue][
-                    'var.validation'].dropna().var()
+                transcript_accuracies[iso]['tissue'][tissue]['validation']['cor'] * transcript_accuracies[iso]['tissue'][tissue]['var.validation']
                 for iso in transcript_accuracies
             ) / transcripts_variance_val,
             'mds': sum(
-                transcript_accuracies[iso]['tissue'][tissue]['validation']['mds'] * transcript_accuracies[iso]['tissue'][tissue][
-                    'var.validation'].dropna().var()
+                transcript_accuracies[iso]['tissue'][tissue]['validation']['mds'] * transcript_accuracies[iso]['tissue'][tissue]['var.validation']
                 for iso in transcript_accuracies
             ) / transcripts_variance_val
         }
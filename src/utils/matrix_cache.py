@@ -0,0 +1,76 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from src.utils.common import make_sure_dir_exists
+
+
+def is_matrix_cache(path):
+    return os.path.isfile(os.path.join(path, 'values.npy'))
+
+
+def numeric_columns(df):
+    """Columns converted to numbers and the mask of numeric ones (some values of the others are not numbers)"""
+    converted = df.apply(pd.to_numeric, errors='coerce')
+    return converted, ~(converted.isna() & df.notna()).any()
+
+
+def save_matrix_cache(df, path, dtype=np.float32):
+    """Save samples x features table as a column-major .npy matrix of `dtype` with index / non-numeric columns sidecars"""
+    converted, numeric = numeric_columns(df)
+    columns = list(df.columns[numeric])
+    meta_columns = list(df.columns[~numeric])
+
+    make_sure_dir_exists(path)
+    # Column-major order keeps every column contiguous, so reading a subset of columns touches only their pages
+    np.save(os.path.join(path, 'values.npy'), np.asfortranarray(converted[columns].to_numpy(dtype=dtype)))
+    with open(os.path.join(path, 'index.json'), 'w') as f:
+        json.dump({'index': [str(i) for i in df.index], 'columns': [str(c) for c in columns]}, f)
+    df[meta_columns].to_csv(os.path.join(path, 'meta.tsv'), sep='\t')
+
+
+def load_matrix_cache(path, columns=None):
+    values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+    with open(os.path.join(path, 'index.json'), 'r') as f:
+        index = json.load(f)
+    meta = pd.read_csv(os.path.join(path, 'meta.tsv'), sep='\t', index_col=0, dtype=str)
+
+    all_columns = pd.Index(index['columns'])
+    if columns is not None:
+        positions = np.sort(all_columns.get_indexer(pd.Index(columns).unique()))
+        positions = positions[positions >= 0]
+        values, all_columns = values[:, positions], all_columns[positions]
+        meta = meta[[c for c in meta.columns if c in set(columns)]]
+
+    df = pd.DataFrame(values, index=pd.Index(index['index']), columns=all_columns, copy=False)
+    for c in meta.columns:
+        df[c] = meta[c].to_numpy()
+
+    return df
+
+
+def read_table(path, columns=None, transpose=False, chunksize=10000, **kwargs):
+    """Read samples x features table (tsv or binary cache), only the `columns` features if specified
+
+    With `transpose`, tsv is a features x samples table, it is streamed by chunks of `chunksize` rows
+    keeping only the `columns` rows, so memory scales with the number of kept features.
+    """
+    if is_matrix_cache(path):
+        return load_matrix_cache(path, columns=columns)
+
+    if transpose:
+        chunks = pd.read_csv(path, sep='\t', index_col=0, chunksize=chunksize, **kwargs)
+        df = pd.concat([chunk if columns is None else chunk[chunk.index.isin(columns)] for chunk in chunks]).T
+        # Rows of non-numeric features (e.g. Cancer) make the columns of their chunk object (strings) before the transpose
+        objects = df.columns[df.dtypes == object]
+        if len(objects):
+            converted, numeric = numeric_columns(df[objects])
+            df[numeric.index[numeric]] = converted.loc[:, numeric]
+        return df
+
+    if columns is not None:
+        header = pd.read_csv(path, sep='\t', nrows=0, **kwargs).columns
+        kwargs['usecols'] = [0] + [i for i, c in enumerate(header) if i > 0 and c in set(columns)]
+    return pd.read_csv(path, sep='\t', index_col=0, **kwargs)
@@ -0,0 +1,219 @@
+import re
+from collections import deque
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+nucleotides = 'ACGU'
+# Nucleotides matched by every IUPAC code (T is read as U)
+iupac_codes = {
+    'A': 'A', 'C': 'C', 'G': 'G', 'U': 'U', 'T': 'U',
+    'R': 'AG', 'Y': 'CU', 'S': 'CG', 'W': 'AU', 'K': 'GU', 'M': 'AC',
+    'B': 'CGU', 'D': 'AGU', 'H': 'ACU', 'V': 'ACG', 'N': 'ACGU',
+}
+
+_codes = np.full(256, len(nucleotides), dtype=np.uint8)
+for _i, _n in enumerate(nucleotides):
+    _codes[[ord(_n), ord(_n.lower())]] = _i
+_codes[[ord('T'), ord('t')]] = nucleotides.index('U')
+
+
+def encode_sequence(sequence):
+    """uint8 codes of the sequence: A, C, G, U (or T) are 0-3, any other letter is 4"""
+    return _codes[np.frombuffer(sequence.encode('ascii', errors='replace'), dtype=np.uint8)]
+
+
+def iupac_matrix(motif):
+    """Matrix (positions x codes) of the nucleotides matched by every position of a degenerate motif"""
+    matrix = np.zeros((len(motif), len(nucleotides) + 1), dtype=bool)
+    for k, code in enumerate(motif.upper()):
+        if code not in iupac_codes:
+            raise ValueError(f'Unknown IUPAC code {code} in motif {motif}')
+        matrix[k, [nucleotides.index(n) for n in iupac_codes[code]]] = True
+
+    return matrix
+
+
+def pwm_matrix(probabilities, pseudocount=0.01, background=0.25):
+    """Log-odds score matrix (positions x codes) of a position probability matrix with A, C, G, U columns"""
+    probabilities = np.asarray(probabilities, dtype=np.float64) + pseudocount
+    scores = np.log2(probabilities / probabilities.sum(axis=1, keepdims=True) / background)
+    # Unknown nucleotides get the lowest score of the position
+    return np.column_stack([scores, scores.min(axis=1)])
+
+
+def read_meme(path):
+    """Motifs of a MEME file: (motif id, name (id if not set), position probability matrix) triples"""
+    motifs = []
+    with open(path, 'r') as f:
+        motif = None
+        for line in f:
+            if line.startswith('MOTIF'):
+                parts = line.split()
+                motif = (parts[1], parts[2] if len(parts) > 2 else parts[1])
+            elif line.strip().startswith('letter-probability matrix') and motif is not None:
+                width = int(re.search(r'w=\s*(\d+)', line).group(1))
+                rows = []
+                while len(rows) < width:
+                    values = next(f).split()
+                    if values:
+                        rows.append(tuple(float(v) for v in values))
+                motifs.append((*motif, tuple(rows)))
+                motif = None
+
+    return motifs
+
+
+class MotifScanner:
+    """Aho-Corasick automaton finding all (overlapping) occurrences of all motifs in a single pass"""
+
+    def __init__(self, motifs):
+        self.motifs = list(dict.fromkeys(motifs))
+        self.lengths = np.array([len(motif) for motif in self.motifs], dtype=np.int64)
+
+        goto, fail, out = [{}], [0], [[]]
+        for motif_id, motif in enumerate(self.motifs):
+            state = 0
+            for char in motif:
+                if char not in goto[state]:
+                    goto[state][char] = len(goto)
+                    goto.append({})
+                    fail.append(0)
+                    out.append([])
+                state = goto[state][char]
+            out[state].append(motif_id)
+
+        # Breadth-first pass sets failure links and turns the trie into a full transition table
+        alphabet = set(''.join(self.motifs))
+        delta = [dict() for _ in goto]
+        delta[0] = {char: goto[0].get(char, 0) for char in alphabet}
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            out[state] = out[state] + out[fail[state]]
+            for char in alphabet:
+                if char in goto[state]:
+                    child = goto[state][char]
+                    fail[child] = delta[fail[state]][char]
+                    delta[state][char] = child
+                    queue.append(child)
+                else:
+                    delta[state][char] = delta[fail[state]][char]
+
+        self.delta = delta
+        self.out = [tuple(motif_ids) for motif_ids in out]
+
+    def scan(self, sequence):
+        """Return start positions and motif ids of all motif occurrences in the sequence"""
+        delta, out = self.delta, self.out
+        ends, motif_ids = [], []
+        state = 0
+        for i, char in enumerate(sequence):
+            state = delta[state].get(char, 0)
+            if out[state]:
+                for motif_id in out[state]:
+                    ends.append(i)
+                    motif_ids.append(motif_id)
+
+        motif_ids = np.array(motif_ids, dtype=np.int64)
+        positions = np.array(ends, dtype=np.int64) - self.lengths[motif_ids] + 1
+
+        return positions, motif_ids
+
+
+class MatrixScanner:
+    """Motifs given by matrices (degenerate motifs and PWMs scores), found by matching all sliding windows at once
+
+    Windows of the encoded sequence are strided views, motifs of the same length are scored together,
+    `chunk_size` bounds the number of window scores held in memory.
+    """
+
+    def __init__(self, matrices, thresholds, chunk_size=2**20):
+        self.lengths = np.array([len(matrix) for matrix in matrices], dtype=np.int64)
+        self.chunk_size = chunk_size
+        self.groups = []
+        # Degenerate motifs (bool matrices, every position has to match) are scored apart from PWMs
+        kinds = np.array([matrix.dtype == bool for matrix in matrices])
+        for length, is_bool in sorted(set(zip(self.lengths.tolist(), kinds.tolist()))):
+            motif_ids = np.flatnonzero((self.lengths == length) & (kinds == is_bool))
+            self.groups.append((
+                length, motif_ids,
+                np.stack([matrices[i] for i in motif_ids]),
+                # Tolerance for the sums of float scores
+                np.array([thresholds[i] for i in motif_ids])[:, None] - 1e-9,
+            ))
+
+    def scan(self, codes):
+        """Return start positions and motif ids of all windows of the encoded sequence matching the motifs"""
+        positions, motif_ids = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for length, ids, matrices, thresholds in self.groups:
+            if len(codes) < length:
+                continue
+            windows = sliding_window_view(codes, length)
+            step = max(1, self.chunk_size // len(ids))
+            for start in range(0, len(windows), step):
+                chunk = windows[start: start + step]
+                if matrices.dtype == bool:
+                    matches = matrices[:, 0, chunk[:, 0]]
+                    for k in range(1, length):
+                        matches &= matrices[:, k, chunk[:, k]]
+                else:
+                    scores = np.zeros((len(ids), len(chunk)))
+                    for k in range(length):
+                        scores += matrices[:, k, chunk[:, k]]
+                    matches = scores >= thresholds
+                found, window = np.nonzero(matches)
+                positions.append(window + start)
+                motif_ids.append(ids[found])
+
+        return np.concatenate(positions), np.concatenate(motif_ids)
+
+
+class MotifsScanner:
+    """Scanner of a motif table: literal motifs (Aho-Corasick), degenerate IUPAC motifs and PWMs (score matrices)
+
+    `pwms` are (name, position probability matrix, relative score threshold) triples, a window matches a PWM if
+    its log-odds score is at least `min + threshold * (max - min)` of the possible scores.
+    """
+
+    def __init__(self, motifs, pwms=()):
+        motifs = list(dict.fromkeys(motifs))
+        literal = [motif for motif in motifs if set(motif) <= set(nucleotides)]
+        degenerate = [motif for motif in motifs if not set(motif) <= set(nucleotides)]
+        pwms = list({name: (name, pwm, threshold) for name, pwm, threshold in pwms}.values())
+        self.motifs = literal + degenerate + [name for name, _, _ in pwms]
+
+        matrices = [iupac_matrix(motif) for motif in degenerate] + [pwm_matrix(pwm) for _, pwm, _ in pwms]
+        thresholds = [len(motif) for motif in degenerate]
+        for matrix, (_, _, threshold) in zip(matrices[len(degenerate):], pwms):
+            low, high = matrix[:, :len(nucleotides)].min(axis=1).sum(), matrix[:, :len(nucleotides)].max(axis=1).sum()
+            thresholds.append(low + threshold * (high - low))
+        self.literal = MotifScanner(literal)
+        self.matrices = MatrixScanner(matrices, thresholds) if matrices else None
+        self.lengths = np.concatenate([self.literal.lengths, self.matrices.lengths if self.matrices else []]).astype(np.int64)
+
+    def scan(self, sequence):
+        """Return start positions and motif ids (in `motifs`) of all motif occurrences in the sequence"""
+        positions, motif_ids = self.literal.scan(sequence)
+        if self.matrices is None:
+            return positions, motif_ids
+
+        matrix_positions, matrix_ids = self.matrices.scan(encode_sequence(sequence))
+        return np.concatenate([positions, matrix_positions]), np.concatenate([motif_ids, matrix_ids + len(self.literal.motifs)])
+
+
+@lru_cache(maxsize=8)
+def get_motif_scanner(motifs, pwms=()):
+    return MotifsScanner(motifs, pwms)
+
+
+def table_motifs(motifs_data):
+    """Motifs and PWMs of a motif table (rows with a `PWM` matrix and its relative score `Threshold`), arguments of `get_motif_scanner`"""
+    if 'PWM' not in motifs_data.columns:
+        return tuple(motifs_data['Motif']), ()
+
+    is_pwm = motifs_data['PWM'].notna()
+    pwms = motifs_data[is_pwm]
+    return tuple(motifs_data.loc[~is_pwm, 'Motif']), tuple(zip(pwms['Motif'], pwms['PWM'], pwms['Threshold']))
@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def max_rss_mb():
+    """Peak resident set size of the current process (MB)"""
+    if resource is None:
+        return float('nan')
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def timed_call(func, item):
+    """Call `func(item)` and return the result with its wall time and the peak RSS of the worker process"""
+    start = time.perf_counter()
+    result = func(item)
+    return result, time.perf_counter() - start, max_rss_mb()
+
+
+class Profiler:
+    """Wall time and memory counters of the pipeline stages
+
+    Every stage record has the stage name, tags (e.g. node path and tissue), wall time,
+    peak RSS of the process at the end of the stage and, if `memory` is set,
+    peak memory allocated by python during the stage (tracemalloc, slows the run down).
+    """
+
+    def __init__(self, enabled=True, memory=False, records=None):
+        self.enabled = enabled
+        self.memory = enabled and memory
+        self.records = list(records or [])
+        self.meta = {}
+        self.start = time.perf_counter()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, **tags):
+        if not self.enabled:
+            yield
+            return
+
+        if self.memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {'stage': name, **tags, 'time': time.perf_counter() - start, 'max_rss_mb': max_rss_mb()}
+            if self.memory:
+                record['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+            self.records.append(record)
+
+    def add(self, name, elapsed, rss=None, **tags):
+        """Add a record of a stage measured elsewhere (e.g. in a worker process)"""
+        if self.enabled:
+            self.records.append({'stage': name, **tags, 'time': elapsed, 'max_rss_mb': max_rss_mb() if rss is None else rss})
+
+    def summary(self):
+        if not self.records:
+            return {}
+        df = pd.DataFrame(self.records)
+        return {
+            stage: {'count': int(len(records)), 'time': float(records['time'].sum()), 'max_rss_mb': float(records['max_rss_mb'].max())}
+            for stage, records in df.groupby('stage', sort=False)
+        }
+
+    def save(self, path, **meta):
+        if not self.enabled:
+            return
+        with open(path, 'w') as f:
+            json.dump({
+                **self.meta,
+                **meta,
+                'total_time': time.perf_counter() - self.start,
+                'max_rss_mb': max_rss_mb(),
+                'summary': self.summary(),
+                'stages': self.records,
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Continue the profile saved to `path` (e.g. to add stages run by another process)"""
+        with open(path, 'r') as f:
+            profile = json.load(f)
+        profiler = cls(records=profile.pop('stages'))
+        profiler.meta = {k: v for k, v in profile.items() if k not in ['total_time', 'max_rss_mb', 'summary']}
+        profiler.start -= profile.get('total_time', 0)
+        return profiler
+
+
+def make_profiler(config):
+    return Profiler(config.get('profile', True), memory=config.get('profile_memory', False))
+
+
+def aggregate_profiles(paths):
+    """Stage summary over the profiles of several runs (e.g. genes of a batch)"""
+    records = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r') as f:
+            profile = json.load(f)
+        records += [{'gene': profile.get('gene'), **record} for record in profile['stages']]
+    if not records:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(records)
+    report = df.groupby('stage', sort=False).agg(
+        count=('time', 'size'),
+        genes=('gene', 'nunique'),
+        total_time=('time', 'sum'),
+        mean_time=('time', 'mean'),
+        max_time=('time', 'max'),
+        max_rss_mb=('max_rss_mb', 'max'),
+    )
+    report['time_share'] = report['total_time'] / df.loc[~df['stage'].str.contains('.', regex=False), 'time'].sum()
+    return report.sort_values('total_time', ascending=False)
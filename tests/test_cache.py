@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import random
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from src.helpers.genes import build_genes_index
+
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_dataset(data_dir, n_samples=120, n_rbps=12, seed=0):
+    """Synthetic gene with 4 isoforms, RBP / isoform expression and motif tables, and its genes index"""
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    exons = [{'exon_number': i, 'start': (i - 1) * 150, 'end': (i - 1) * 150 + 50} for i in range(1, 9)]
+    structure = {'ENST1': [1, 2, 3, 4, 5, 6, 7, 8], 'ENST2': [1, 2, 4, 5, 6, 7, 8], 'ENST3': [1, 2, 4, 6, 7, 8], 'ENST4': [1, 2, 3, 4, 5, 7, 8]}
+    genes = {'SYN': {
+        'gene_name': 'SYN',
+        'exons': exons,
+        'sequence': ''.join(random.choice('ACGT') for _ in range(len(exons) * 150)),
+        'transcripts': [{'transcript_id': t, 'exons': [exons[e - 1] for e in numbers]} for t, numbers in structure.items()],
+    }}
+    with open(os.path.join(data_dir, 'genes.json'), 'w') as f:
+        json.dump(genes, f)
+    build_genes_index(os.path.join(data_dir, 'genes.json'), os.path.join(data_dir, 'genes.sqlite'))
+
+    samples = [f'S{i}' for i in range(n_samples)]
+    rbps = [f'R{i}' for i in range(n_rbps)]
+    rbp_df = pd.DataFrame(rng.normal(5, 2, size=(n_samples, n_rbps)), index=samples, columns=rbps)
+    logits = rbp_df.to_numpy() @ rng.normal(0, 0.3, size=(n_rbps, len(structure)))
+    isoforms_df = pd.DataFrame(np.exp(logits - logits.mean(axis=0)) * 10, index=samples, columns=list(structure))
+    rbp_df['Cancer'] = rng.choice(['T1', 'T2'], size=n_samples)
+    # Isoform table lists the samples in another order, the common samples must not depend on it
+    rbp_df.to_csv(os.path.join(data_dir, 'rbps.tsv'), sep='\t')
+    isoforms_df.iloc[::-1].to_csv(os.path.join(data_dir, 'isoforms.tsv'), sep='\t')
+    pd.DataFrame({
+        'Gene': [r for r in rbps for _ in range(3)],
+        'Motif': [''.join(random.choice('ACGU') for _ in range(4)) for _ in range(3 * n_rbps)],
+    }).to_csv(os.path.join(data_dir, 'motifs.tsv'), sep='\t')
+
+
+def run_build(config_path, data_dir, hash_seed):
+    env = {
+        **os.environ,
+        'PYTHONHASHSEED': str(hash_seed),
+        'SRPSEQ_GENES_INDEX': os.path.join(data_dir, 'genes.sqlite'),
+    }
+    return subprocess.run(
+        [sys.executable, os.path.join(repo_dir, 'srpseq'), 'build', '-c', config_path],
+        env=env, cwd=repo_dir, capture_output=True, text=True, check=True,
+    ).stderr
+
+
+def test_rerun_hits_cache(tmp_path):
+    make_dataset(str(tmp_path))
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps({
+        'gene': 'SYN',
+        'output_dir': 'output',
+        'rbp_data_path': 'rbps.tsv',
+        'isoforms_data_path': 'isoforms.tsv',
+        'rbps_path': 'motifs.tsv',
+        'rbps_tresh_mean': 0,
+        'rbps_tresh_var': 0,
+        'isoforms_tresh_mean': 0,
+        'isoforms_tresh_var': 0,
+        'tissue_specific': True,
+        'plots': 'none',
+    }))
+
+    # Fresh interpreters with different hash seeds, the second run must reuse the split and all fitted models
+    first = run_build(str(config_path), str(tmp_path), hash_seed=1)
+    second = run_build(str(config_path), str(tmp_path), hash_seed=2)
+    assert '(0 cached)' in first
+    assert 'fitting 0 models' in second
@@ -0,0 +1,16 @@
+import numpy as np
+
+from src.utils.common import empty_scores, get_batch_scores
+
+
+def test_batch_scores_without_samples():
+    assert get_batch_scores(np.zeros((0, 3)), np.zeros((0, 3))) == [empty_scores] * 3
+
+
+def test_batch_scores_constant_predictions():
+    rng = np.random.default_rng(0)
+    pred, true = rng.normal(size=(20, 2)), rng.uniform(.1, .9, size=(20, 2))
+    pred[:, 1] = .3
+    scores = get_batch_scores(pred, true)
+    assert np.isfinite(scores[0]['cor'])
+    assert np.isnan(scores[1]['cor'])